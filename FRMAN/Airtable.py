@@ -1,41 +1,541 @@
 """FUNCTIONS FOR AIRTABLE INTEGRATION."""
 
-from airtable import Airtable as _airtable
-from pandas import DataFrame
-from pandas.io.json import json_normalize
+from datetime import datetime, timedelta
+from json import loads
+from threading import Lock
+from time import monotonic, sleep
+from urllib.parse import quote
+
+from FRMAN.Metrics import incr, timed
+from FRMAN.Utils import lazy_import
+
+pandas = lazy_import("pandas")
+
+
+class RateLimiter:
+    """THREAD-SAFE TOKEN BUCKET ALLOWING `rate` REQUESTS PER SECOND."""
+
+    def __init__(self, rate=5, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def acquire(self):
+        """BLOCK UNTIL A REQUEST MAY BE SENT."""
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+
+_limiters = dict()
+_limiters_lock = Lock()
+
+
+def rate_limiter(base, rate=5):
+    """RETURN THE RATE LIMITER SHARED BY EVERY CONNECTION TO `base`."""
+    with _limiters_lock:
+        if base not in _limiters:
+            _limiters[base] = RateLimiter(rate=rate)
+        return _limiters[base]
 
 
 class Airtable:
     """Interactions With AirTable."""
 
-    def __init__(self, base, table, api_key):
+    BATCH_SIZE = 10
+    RETRIES = 5
+    BACKOFF = 1.0
+    SYNC_OVERLAP = 60
+
+    def __init__(self, base, table, api_key, api_url=None):
         """RETURN AIRTABLE CONNECTION.
+        :param str api_url: API root replacing https://api.airtable.com/v0,
+            e.g. a proxy or the local fake server in benchmarks/
         :rtype: object
         """
         self.base = base
         self.table = table
+        from airtable import Airtable as _airtable
         airtable = _airtable(base, table, api_key=api_key)
+        if api_url is not None:
+            airtable.url_table = "/".join(
+                [api_url.rstrip("/"), base, quote(table, safe="")])
         self.airtable_conn = airtable
+        self.limiter = rate_limiter(base)
+
+    @timed("airtable.get_airtable_raw")
+    def get_airtable_raw(self, params=None, fields=None, view=None,
+                         sort=None, max_records=None, cache=None):
+        """
+        Get Data From AirTable.
+        :param SnapshotCache cache: serve fresh snapshots from, and store
+            new pulls in, this local cache
+        """
+        if cache is not None:
+            return cache.fetch(
+                "airtable:" + self.base + "/" + self.table,
+                lambda: self.get_airtable_raw(params, fields, view, sort,
+                                              max_records),
+                params=params, fields=fields, view=view, sort=sort,
+                max_records=max_records)
+        dataframes = list(self.iter_airtable_raw(
+            params=params, fields=fields, view=view, sort=sort,
+            max_records=max_records))
+        if len(dataframes) == 1:
+            return dataframes[0]
+        return pandas.concat(dataframes, ignore_index=True, sort=False) \
+            if dataframes else pandas.DataFrame()
+
+    def iter_airtable_raw(self, params=None, fields=None, view=None,
+                          sort=None, max_records=None, page_size=None):
+        """
+        YIELD ONE NORMALIZED DATAFRAME PER AIRTABLE PAGE.
+
+        PROJECTION, VIEW, SORT AND LIMITS ARE SENT TO THE API SO ONLY THE
+        REQUESTED RECORDS AND COLUMNS ARE TRANSFERRED.
 
-    def get_airtable_raw(self, params=None):
-        """Get Data From AirTable."""
-        results = self.airtable_conn.get_all(filterByFormula=params)
-        dataframe = DataFrame(json_normalize(results))
-        dataframe.rename(columns=lambda x: x.replace(
-            "fields.", ""), inplace=True)
+        Example:
+            for chunk in airtable.iter_airtable_raw(fields=["Name"]):
+                sql.ingest_df(chunk, "requests")
+        :param str params: filterByFormula formula
+        :param list fields: field names to return
+        :param str view: view name or id
+        :param list sort: field names, or (field, "asc"/"desc") tuples
+        :param int max_records: maximum records across all pages
+        :param int page_size: records per page (max 100)
+        :return: generator of DataFrames
+        """
+        options = {"formula": params, "fields": fields, "view": view,
+                   "sort": sort, "max_records": max_records,
+                   "page_size": page_size}
+        options = {name: value for name, value in options.items()
+                   if value is not None}
+        for records in self.airtable_conn.get_iter(**options):
+            incr("airtable.requests")
+            incr("airtable.rows_read", len(records))
+            yield self.normalize(records)
+
+    @staticmethod
+    @timed("airtable.normalize")
+    def normalize(records):
+        """FLATTEN AIRTABLE RECORDS, DROPPING THE "fields." PREFIX."""
+        from pandas.io.json import json_normalize
+        dataframe = json_normalize(records)
+        prefix = len("fields.")
+        dataframe.columns = [column[prefix:]
+                             if column.startswith("fields.") else column
+                             for column in dataframe.columns]
         return dataframe
 
+    @timed("airtable.sync_to_sql")
+    def sync_to_sql(self, sql, table_name=None, modified_field=None,
+                    fields=None, reconcile_deletes=None, scan_field=None):
+        """
+        INCREMENTALLY COPY THIS TABLE INTO SQLITE.
+
+        ONLY RECORDS MODIFIED SINCE THE LAST STORED WATERMARK ARE FETCHED
+        (VIA LAST_MODIFIED_TIME()) AND UPSERTED BY RECORD ID. DELETES ARE
+        RECONCILED WITH A SCAN OF THE TABLE PROJECTED TO ONE SMALL FIELD.
+        :param SQL sql: destination database
+        :param str table_name: destination table, defaults to this table
+        :param str modified_field: last-modified-time field; its max value
+            becomes the next watermark, capped at the sync start time less
+            SYNC_OVERLAP so records edited mid-sync on pages already read
+            are fetched again. Without it that capped start time is used.
+        :param list fields: field projection for changed records
+        :param bool reconcile_deletes: drop rows deleted in Airtable;
+            by default only when there is a field to scan for them
+        :param str scan_field: the only field requested by the delete scan,
+            defaults to `modified_field`, then the first of `fields`;
+            required when `reconcile_deletes` is True
+        :return: dict with "upserted", "deleted" and "watermark"
+        """
+        scan_field = scan_field or modified_field or \
+            (list(fields)[0] if fields else None)
+        if reconcile_deletes is None:
+            reconcile_deletes = scan_field is not None
+        elif reconcile_deletes and scan_field is None:
+            raise ValueError("sync_to_sql needs a scan_field, modified_field "
+                             "or fields to reconcile deletes")
+        table_name = table_name or self.table
+        watermark_name = self.base + "." + self.table
+        watermark = sql.get_watermark(watermark_name)
+        started = datetime.utcnow() - timedelta(seconds=self.SYNC_OVERLAP)
+        formula = None
+        if watermark is not None:
+            formula = "IS_AFTER(LAST_MODIFIED_TIME(), '{}')".format(
+                watermark)
+        if fields is not None and modified_field is not None:
+            fields = list(fields) + [modified_field]
+        upserted = 0
+        latest = watermark
+        for chunk in self.iter_airtable_raw(params=formula, fields=fields):
+            if chunk.empty:
+                continue
+            sql.upsert_df(chunk, table_name, "id")
+            upserted += len(chunk)
+            if modified_field is not None and modified_field in chunk:
+                page_latest = chunk[modified_field].dropna().max()
+                if isinstance(page_latest, str) and \
+                        (latest is None or page_latest > latest):
+                    latest = page_latest
+        started = started.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        if modified_field is None or (latest is not None and
+                                      latest > started):
+            latest = started
+        deleted = 0
+        if reconcile_deletes and (watermark is not None or upserted):
+            record_ids = [record["id"] for page in
+                          self.airtable_conn.get_iter(fields=[scan_field])
+                          for record in page]
+            deleted = sql.delete_missing(table_name, "id", record_ids)
+        if latest is not None:
+            sql.set_watermark(watermark_name, latest)
+        return {"upserted": upserted, "deleted": deleted,
+                "watermark": latest}
+
+    @timed("airtable.insert_json")
     def insert_json(self, json, imported=True):
         """
         INSERT RECORDS INTO AIRTABLE.
         """
+        self.limiter.acquire()
+        incr("airtable.requests")
         result = self.airtable_conn.insert(json, typecast=True)
         return result
 
+    @timed("airtable.update")
     def update(self, record_id, fields, typecast=True, run=True):
         """UPDATE RECORDS BY ID AND DICT."""
+        self.limiter.acquire()
+        incr("airtable.requests")
         self.airtable_conn.update(record_id, fields, typecast=typecast)
 
+    @timed("airtable.delete")
     def delete(self, record_id):
         """DELETE RECORD BY ID."""
+        self.limiter.acquire()
+        incr("airtable.requests")
         self.airtable_conn.delete(record_id)
+
+    @timed("airtable.insert_many")
+    def insert_many(self, records, typecast=True):
+        """
+        INSERT RECORDS IN BATCHES OF 10.
+        :param list records: field dicts to insert
+        :return: one result per record, in order: the created record, or
+            {"error": message} if its batch failed
+        """
+        return self._batched("post", records, lambda batch: {"json": {
+            "records": [{"fields": fields} for fields in batch],
+            "typecast": typecast}})
+
+    @timed("airtable.update_many")
+    def update_many(self, records, typecast=True):
+        """
+        UPDATE RECORDS IN BATCHES OF 10.
+        :param list records: dicts of {"id": record_id, "fields": {...}}
+        :return: one result per record, in order (see `insert_many`)
+        """
+        return self._batched("patch", records, lambda batch: {"json": {
+            "records": [{"id": record["id"], "fields": record["fields"]}
+                        for record in batch],
+            "typecast": typecast}})
+
+    @timed("airtable.delete_many")
+    def delete_many(self, record_ids):
+        """
+        DELETE RECORDS BY ID IN BATCHES OF 10.
+        :param list record_ids: record ids to delete
+        :return: one result per record, in order (see `insert_many`)
+        """
+        return self._batched("delete", record_ids, lambda batch: {
+            "params": {"records[]": list(batch)}})
+
+    @timed("airtable.upsert_many")
+    def upsert_many(self, records, key_field, typecast=True):
+        """
+        UPDATE RECORDS WHOSE `key_field` VALUE ALREADY EXISTS, INSERT THE
+        REST. EXISTING KEYS ARE FOUND WITH ONE SCAN OF THAT FIELD ONLY.
+        :param list records: field dicts, each holding `key_field`
+        :param str key_field: field that identifies a record
+        :return: one result per record, in order (see `insert_many`)
+        """
+        existing = dict()
+        for page in self.airtable_conn.get_iter(fields=[key_field]):
+            for record in page:
+                value = record.get("fields", {}).get(key_field)
+                if value is not None:
+                    existing.setdefault(value, record["id"])
+        updates, inserts = [], []
+        for index, fields in enumerate(records):
+            record_id = existing.get(fields.get(key_field))
+            if record_id is None:
+                inserts.append((index, fields))
+            else:
+                updates.append((index, {"id": record_id, "fields": fields}))
+        results = [None] * len(records)
+        for batch, method in ((updates, self.update_many),
+                              (inserts, self.insert_many)):
+            outcome = method([item for _, item in batch], typecast=typecast)
+            for (index, _), result in zip(batch, outcome):
+                results[index] = result
+        return results
+
+    def _batched(self, method, items, build):
+        """SEND `items` 10 AT A TIME, COLLECTING PER-RECORD RESULTS."""
+        from requests.exceptions import RequestException
+        results = []
+        items = list(items)
+        for start in range(0, len(items), self.BATCH_SIZE):
+            batch = items[start:start + self.BATCH_SIZE]
+            try:
+                data = self._send(method, **build(batch))
+                results.extend(data.get("records", []))
+                incr("airtable.rows_written", len(batch))
+            except RequestException as error:
+                results.extend({"error": str(error)} for _ in batch)
+        return results
+
+    def _send(self, method, **kwargs):
+        """
+        SEND ONE RATE-LIMITED REQUEST TO THE TABLE, RETRYING 429, 5XX AND
+        CONNECTION ERRORS WITH EXPONENTIAL BACKOFF (OR Retry-After).
+        """
+        from requests.exceptions import ConnectionError, Timeout
+        session = self.airtable_conn.session
+        url = self.airtable_conn.url_table
+        for attempt in range(self.RETRIES + 1):
+            self.limiter.acquire()
+            incr("airtable.requests")
+            try:
+                response = session.request(method, url, **kwargs)
+            except (ConnectionError, Timeout):
+                if attempt == self.RETRIES:
+                    raise
+                incr("airtable.retries")
+                sleep(self.BACKOFF * 2 ** attempt)
+                continue
+            incr("airtable.bytes_received", len(response.content))
+            if response.status_code == 429:
+                incr("airtable.throttled")
+            retryable = response.status_code == 429 or \
+                response.status_code >= 500
+            if not retryable or attempt == self.RETRIES:
+                break
+            incr("airtable.retries")
+            retry_after = response.headers.get("Retry-After")
+            sleep(float(retry_after) if retry_after
+                  else self.BACKOFF * 2 ** attempt)
+        response.raise_for_status()
+        return response.json()
+
+
+class AsyncRateLimiter:
+    """
+    TOKEN BUCKET FOR COROUTINES ON ONE EVENT LOOP: `rate` REQUESTS PER
+    SECOND. EACH CALLER RESERVES THE NEXT FREE SLOT, SO NO LOCK IS NEEDED.
+    """
+
+    def __init__(self, rate=5, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = monotonic()
+
+    async def acquire(self):
+        """WAIT UNTIL A REQUEST MAY BE SENT."""
+        from asyncio import sleep as async_sleep
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            await async_sleep(-self.tokens / self.rate)
+
+
+class AsyncAirtable:
+    """
+    CONCURRENT EXTRACTION FROM MANY AIRTABLE TABLES AND BASES OVER ONE
+    POOLED KEEP-ALIVE aiohttp SESSION. TABLES ARE PAGED IN PARALLEL WHILE
+    EACH BASE STAYS UNDER ITS OWN RATE LIMIT, SO A REFRESH TAKES ROUGHLY AS
+    LONG AS ITS SLOWEST BASE.
+
+    Example:
+        frames = get_tables({
+            "requests": ("appXXXX", "Requests"),
+            "volunteers": ("appXXXX", "Volunteers"),
+            "deliveries": {"base": "appYYYY", "table": "Deliveries",
+                           "fields": ["Status", "Date"]}}, api_key)
+        requests_df = frames["requests"]
+    """
+
+    API_URL = "https://api.airtable.com/v0"
+    RETRIES = Airtable.RETRIES
+    BACKOFF = Airtable.BACKOFF
+
+    def __init__(self, api_key, api_url=None, rate=5, connections=20,
+                 timeout=60):
+        """
+        :param str api_key: Airtable API key
+        :param str api_url: API root, see `Airtable`
+        :param float rate: requests per second allowed per base
+        :param int connections: keep-alive connections in the pool
+        :param float timeout: seconds allowed per request
+        """
+        self.api_key = api_key
+        self.api_url = (api_url or self.API_URL).rstrip("/")
+        self.rate = rate
+        self.connections = connections
+        self.timeout = timeout
+        self.session = None
+        self.limiters = dict()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        """OPEN THE POOLED SESSION."""
+        import aiohttp
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                headers={"Authorization": "Bearer " + self.api_key},
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self):
+        """CLOSE THE POOLED SESSION."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def limiter(self, base):
+        """RETURN THE RATE LIMITER SHARED BY EVERY REQUEST TO `base`."""
+        if base not in self.limiters:
+            self.limiters[base] = AsyncRateLimiter(rate=self.rate)
+        return self.limiters[base]
+
+    @timed("airtable.async_get_airtable_raw")
+    async def get_airtable_raw(self, base, table, params=None, fields=None,
+                               view=None, sort=None, max_records=None,
+                               page_size=None):
+        """
+        GET ONE TABLE, IN THE SAME SHAPE AS `Airtable.get_airtable_raw`.
+        ARGUMENTS AS IN `Airtable.iter_airtable_raw`.
+        """
+        dataframes = [dataframe async for dataframe in self.iter_airtable_raw(
+            base, table, params=params, fields=fields, view=view, sort=sort,
+            max_records=max_records, page_size=page_size)]
+        if len(dataframes) == 1:
+            return dataframes[0]
+        return pandas.concat(dataframes, ignore_index=True, sort=False) \
+            if dataframes else pandas.DataFrame()
+
+    async def iter_airtable_raw(self, base, table, params=None, fields=None,
+                                view=None, sort=None, max_records=None,
+                                page_size=None):
+        """YIELD ONE NORMALIZED DATAFRAME PER PAGE OF ONE TABLE."""
+        from airtable.params import AirtableParams
+        options = {"formula": params, "fields": fields, "view": view,
+                   "sort": sort, "max_records": max_records,
+                   "page_size": page_size}
+        query = []
+        for name, value in options.items():
+            if value is None:
+                continue
+            for key, encoded in AirtableParams._get(name)(
+                    value).to_param_dict().items():
+                if isinstance(encoded, list):
+                    query.extend((key, item) for item in encoded)
+                else:
+                    query.append((key, str(encoded)))
+        url = "/".join([self.api_url, base, quote(table, safe="")])
+        offset = None
+        while True:
+            page = query + [("offset", offset)] if offset else query
+            data = await self._get(base, url, page)
+            records = data.get("records", [])
+            incr("airtable.rows_read", len(records))
+            yield Airtable.normalize(records)
+            offset = data.get("offset")
+            if not offset:
+                break
+
+    async def get_tables(self, tables):
+        """
+        GET MANY TABLES CONCURRENTLY.
+        :param dict tables: name -> (base, table) tuple, or name -> dict of
+            "base", "table" and any `get_airtable_raw` keyword arguments
+        :return: dict of name -> DataFrame
+        """
+        requests = []
+        for spec in tables.values():
+            if not isinstance(spec, dict):
+                spec = {"base": spec[0], "table": spec[1]}
+            requests.append(self.get_airtable_raw(**spec))
+        from asyncio import gather
+        return dict(zip(tables, await gather(*requests)))
+
+    async def _get(self, base, url, query):
+        """
+        SEND ONE RATE-LIMITED GET, RETRYING 429, 5XX AND CONNECTION ERRORS
+        WITH EXPONENTIAL BACKOFF (OR Retry-After), AS `Airtable._send`.
+        """
+        from asyncio import TimeoutError, sleep as async_sleep
+        from aiohttp import ClientConnectionError
+        limiter = self.limiter(base)
+        for attempt in range(self.RETRIES + 1):
+            await limiter.acquire()
+            incr("airtable.requests")
+            try:
+                async with self.session.get(url, params=query) as response:
+                    body = await response.read()
+            except (ClientConnectionError, TimeoutError):
+                if attempt == self.RETRIES:
+                    raise
+                incr("airtable.retries")
+                await async_sleep(self.BACKOFF * 2 ** attempt)
+                continue
+            incr("airtable.bytes_received", len(body))
+            if response.status == 429:
+                incr("airtable.throttled")
+            retryable = response.status == 429 or response.status >= 500
+            if not retryable or attempt == self.RETRIES:
+                break
+            incr("airtable.retries")
+            retry_after = response.headers.get("Retry-After")
+            await async_sleep(float(retry_after) if retry_after
+                              else self.BACKOFF * 2 ** attempt)
+        response.raise_for_status()
+        return loads(body)
+
+
+def get_tables(tables, api_key, **kwargs):
+    """
+    BLOCKING ENTRY POINT: GET MANY TABLES CONCURRENTLY WITH `AsyncAirtable`.
+    :param dict tables: see `AsyncAirtable.get_tables`
+    :param str api_key: Airtable API key
+    :param kwargs: passed to `AsyncAirtable`
+    :return: dict of name -> DataFrame
+    """
+    from asyncio import run
+
+    async def fetch():
+        async with AsyncAirtable(api_key, **kwargs) as client:
+            return await client.get_tables(tables)
+    return run(fetch())
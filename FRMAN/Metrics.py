@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+"""
+HOT-PATH INSTRUMENTATION: CALL TIMERS AND COUNTERS FOR AIRTABLE, SHEETS
+AND SQL, WITH JSON LOG AND PROMETHEUS TEXT EXPORT.
+
+DISABLED BY DEFAULT; A DISABLED TIMER OR COUNTER IS ONE BOOLEAN CHECK.
+ENABLE WITH `enable()` OR THE ${FRMAN_METRICS} ENVIRONMENTAL VARIABLE.
+
+Example:
+    from FRMAN import Metrics
+    Metrics.enable()
+    airtable.get_airtable_raw()
+    Metrics.log_json()
+    Metrics.write_prometheus("metrics.prom")
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+from inspect import iscoroutinefunction
+from json import dumps
+from logging import getLogger
+from os import environ
+from os.path import join
+from re import sub
+from threading import Lock
+from time import perf_counter
+
+_enabled = str(environ.get(key="FRMAN_METRICS", default="")).lower() in \
+    ["true", "t", "yes", "y", "1"]
+_lock = Lock()
+_timers = dict()
+_counters = dict()
+
+
+def enable():
+    """START RECORDING."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """STOP RECORDING (RECORDED VALUES ARE KEPT)."""
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    """WHETHER METRICS ARE BEING RECORDED."""
+    return _enabled
+
+
+def reset():
+    """DROP EVERY RECORDED VALUE."""
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def incr(name, value=1):
+    """ADD `value` TO COUNTER `name`, E.G. "airtable.rows"."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def record(name, seconds, error=False):
+    """ADD ONE CALL OF `seconds` TO TIMER `name`."""
+    if not _enabled:
+        return
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            timer = _timers[name] = {"calls": 0, "errors": 0,
+                                     "seconds": 0.0, "max_seconds": 0.0}
+        timer["calls"] += 1
+        timer["errors"] += error
+        timer["seconds"] += seconds
+        timer["max_seconds"] = max(timer["max_seconds"], seconds)
+
+
+def timed(name):
+    """
+    DECORATOR RECORDING EVERY CALL OF A FUNCTION (OR COROUTINE FUNCTION)
+    UNDER TIMER `name`.
+    """
+    def decorator(function):
+        if iscoroutinefunction(function):
+            @wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await function(*args, **kwargs)
+                began = perf_counter()
+                try:
+                    result = await function(*args, **kwargs)
+                except Exception:
+                    record(name, perf_counter() - began, error=True)
+                    raise
+                record(name, perf_counter() - began)
+                return result
+            return async_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            began = perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except Exception:
+                record(name, perf_counter() - began, error=True)
+                raise
+            record(name, perf_counter() - began)
+            return result
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """COPY OF EVERY TIMER AND COUNTER."""
+    with _lock:
+        return {"timers": {name: dict(timer)
+                           for name, timer in _timers.items()},
+                "counters": dict(_counters)}
+
+
+def log_json(logger=None, level=20):
+    """LOG THE SNAPSHOT AS ONE JSON LINE."""
+    (logger or getLogger(__name__)).log(
+        level, dumps({"frman_metrics": snapshot()}, sort_keys=True))
+
+
+def _metric_name(name):
+    return sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def prometheus_text():
+    """THE SNAPSHOT IN PROMETHEUS TEXT EXPOSITION FORMAT."""
+    current = snapshot()
+    lines = []
+    for metric, field, kind in (
+            ("frman_calls_total", "calls", "counter"),
+            ("frman_call_errors_total", "errors", "counter"),
+            ("frman_call_seconds_total", "seconds", "counter"),
+            ("frman_call_max_seconds", "max_seconds", "gauge")):
+        lines.append("# TYPE {} {}".format(metric, kind))
+        for name, timer in sorted(current["timers"].items()):
+            lines.append('{}{{call="{}"}} {}'.format(
+                metric, name, timer[field]))
+    for name, value in sorted(current["counters"].items()):
+        metric = "frman_" + _metric_name(name) + "_total"
+        lines.append("# TYPE {} counter".format(metric))
+        lines.append("{} {}".format(metric, value))
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(file_path):
+    """WRITE `prometheus_text()` FOR A NODE-EXPORTER TEXTFILE COLLECTOR."""
+    with open(file_path, "w") as output:
+        output.write(prometheus_text())
+
+
+@contextmanager
+def profile(job="job", cprofile=True, memory=False, output_dir=None,
+            top=20):
+    """
+    RECORD METRICS FOR A BLOCK, OPTIONALLY UNDER cProfile AND tracemalloc.
+
+    Example:
+        with profile("nightly", memory=True, output_dir="logs") as report:
+            run_sync()
+        print(report["seconds"], report["peak_bytes"])
+    :param str job: name used for the timer and output files
+    :param bool cprofile: capture a cProfile (written to <job>.prof)
+    :param bool memory: capture tracemalloc peak and top allocations
+    :param str output_dir: where to write <job>.prof, if anywhere
+    :param int top: allocation sites kept in the report
+    :return: dict filled in when the block exits
+    """
+    was_enabled = _enabled
+    enable()
+    report = {"job": job}
+    profiler = None
+    if cprofile:
+        from cProfile import Profile
+        profiler = Profile()
+    if memory:
+        import tracemalloc
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+    began = perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield report
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        report["seconds"] = perf_counter() - began
+        record("job." + job, report["seconds"])
+        if memory and tracemalloc.is_tracing():
+            report["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            report["top_allocations"] = [
+                str(stat) for stat in tracemalloc.take_snapshot()
+                .statistics("lineno")[:top]]
+            if not was_tracing:
+                tracemalloc.stop()
+        if profiler is not None:
+            report["profile"] = profiler
+            if output_dir is not None:
+                report["profile_path"] = join(output_dir, job + ".prof")
+                profiler.dump_stats(report["profile_path"])
+        report["metrics"] = snapshot()
+        if not was_enabled:
+            disable()
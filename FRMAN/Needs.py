@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""
+MULTI-SELECT "NEEDS" ANSWER PARSING.
+"""
+
+from functools import lru_cache
+from re import compile, escape
+
+from FRMAN.Utils import lazy_import
+
+numpy = lazy_import("numpy")
+pandas = lazy_import("pandas")
+
+
+class NeedsMatcher:
+    """
+    MATCH MULTI-SELECT ANSWERS (OPTIONS JOINED WITH ", ") AGAINST A FIXED
+    OPTION LIST. THE OPTIONS ARE COMPILED ONCE INTO A SINGLE ALTERNATION
+    REGEX AND EVERY DISTINCT ANSWER IS PARSED ONLY ONCE.
+
+    Example:
+        matcher = NeedsMatcher.from_yaml(yml("migration/sheets.yaml"))
+        parsed = matcher.parse(requests_df["What do you need?"])
+        requests_df["needs_list"] = parsed["needs_list"]
+    """
+
+    def __init__(self, options, other="Other", question="What do you need?",
+                 cache_size=65536):
+        """
+        :param list options: the fixed answer options
+        :param str other: label added when free text is left over
+        :param str question: heading used in the leftover info text
+        :param int cache_size: distinct answers memoized
+        """
+        self.options = list(options)
+        self.other = other
+        self.question = question
+        longest_first = sorted(set(self.options), key=len, reverse=True)
+        self.pattern = compile("(" + "|".join(
+            escape(option) for option in longest_first) + ")(?:, )?")
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    @classmethod
+    def from_yaml(cls, sheet_yaml, key="default_needs", **kwargs):
+        """BUILD FROM A PARSED MIGRATION YAML (SEE migration/sheets.yaml)."""
+        return cls(sheet_yaml[key], **kwargs)
+
+    def _match(self, answer):
+        """
+        PARSE ONE ANSWER.
+        :return: tuple of (needs list, leftover info text)
+        """
+        if not isinstance(answer, str):
+            return [], ""
+        found = set(self.pattern.findall(answer))
+        needs = [option for option in self.options if option in found]
+        leftover = self.pattern.sub("", answer)
+        if len(leftover) > 0:
+            needs.append(self.other)
+            info = "{}:\n{}\n\n".format(self.question, leftover)
+        else:
+            info = ""
+        return needs, info
+
+    def _parsed(self, series):
+        """FACTORIZE A SERIES AND PARSE EACH DISTINCT ANSWER ONCE."""
+        codes, uniques = pandas.factorize(series)
+        needs = numpy.empty(len(uniques) + 1, dtype=object)
+        info = numpy.empty(len(uniques) + 1, dtype=object)
+        for position, answer in enumerate(uniques):
+            needs[position], info[position] = self.match(answer)
+        needs[-1], info[-1] = [], ""
+        return codes, uniques, needs, info
+
+    def parse(self, series):
+        """
+        PARSE A WHOLE SERIES.
+        :return: DataFrame with "needs_list" and "additional_info" columns,
+            on the series' index
+        """
+        codes, _, needs, info = self._parsed(series)
+        return pandas.DataFrame({"needs_list": needs[codes],
+                                 "additional_info": info[codes]},
+                                index=series.index)
+
+    def explode(self, series):
+        """ONE ROW PER (ANSWER ROW, NEED), ON THE SERIES' INDEX."""
+        codes, _, needs, _ = self._parsed(series)
+        return pandas.Series(needs[codes], index=series.index,
+                             name="need").explode()
+
+    def one_hot(self, series):
+        """
+        ONE BOOLEAN COLUMN PER OPTION (PLUS `other`), ON THE SERIES' INDEX.
+        """
+        codes, uniques, needs, _ = self._parsed(series)
+        columns = self.options + [self.other]
+        flags = pandas.DataFrame(False, index=range(len(uniques) + 1),
+                                 columns=columns)
+        for position, answer_needs in enumerate(needs):
+            if answer_needs:
+                flags.loc[position, answer_needs] = True
+        dataframe = flags.take(codes)
+        dataframe.index = series.index
+        return dataframe
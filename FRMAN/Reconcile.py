@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+"""
+CONTENT-HASH RECONCILIATION FOR AIRTABLE WRITE-BACK.
+"""
+
+from FRMAN.Metrics import incr, timed
+from FRMAN.Utils import lazy_import
+
+numpy = lazy_import("numpy")
+pandas = lazy_import("pandas")
+
+
+class Reconciler:
+    """
+    SEND ONLY THE RECORDS WHOSE CONTENT CHANGED SINCE THEY WERE LAST WRITTEN
+    TO (OR READ FROM) AIRTABLE.
+
+    A 64-BIT HASH OF EACH RECORD'S `fields` IS KEPT IN SQLITE
+    (`SQL.HASH_TABLE`). `push` HASHES THE WHOLE FRAME IN ONE VECTORIZED PASS,
+    COMPARES IT WITH THE STORED HASHES AND UPDATES ONLY THE DIFFERENCES
+    (ROWS WITHOUT AN ID ARE INSERTED).
+
+    Example:
+        reconciler = Reconciler(airtable, sql, fields=["Status", "Notes"])
+        reconciler.remember(airtable.get_airtable_raw())
+        print(reconciler.push(cleaned_df, dry_run=True)["diff"])
+        reconciler.push(cleaned_df)
+    """
+
+    def __init__(self, airtable, sql, fields=None, key="id", scope=None):
+        """
+        :param Airtable airtable: destination table
+        :param SQL sql: database holding the hash side table
+        :param list fields: fields hashed and sent, default every column but
+            `key` and "createdTime"
+        :param str key: column holding the Airtable record id
+        :param str scope: hash namespace, default "<base>.<table>"
+        """
+        self.airtable = airtable
+        self.sql = sql
+        self.fields = list(fields) if fields is not None else None
+        self.key = key
+        self.scope = scope or airtable.base + "." + airtable.table
+
+    def _fields(self, dataframe):
+        if self.fields is not None:
+            return self.fields
+        return [column for column in dataframe.columns
+                if column not in (self.key, "createdTime", "action", "hash")]
+
+    def hash(self, dataframe):
+        """
+        SIGNED 64-BIT CONTENT HASH OF EVERY ROW OVER THE HASHED FIELDS.
+        VALUES ARE COMPARED AS TEXT, SO 1 AND "1" OR NaN AND None MATCH.
+        """
+        fields = self._fields(dataframe)
+        missing = [field for field in fields if field not in dataframe]
+        if missing:
+            raise KeyError("Fields not in dataframe: " + str(missing))
+        text = dataframe[fields].astype(object)
+        text = text.where(text.notna(), "").astype(str)
+        text.columns = range(len(fields))
+        hashes = pandas.util.hash_pandas_object(text, index=False)
+        return pandas.Series(hashes.values.view(numpy.int64),
+                             index=dataframe.index)
+
+    @timed("reconcile.diff")
+    def diff(self, dataframe):
+        """
+        RECORDS THAT DIFFER FROM THE STORED HASHES.
+        :return: DataFrame of the changed rows plus "action" ("insert" or
+            "update") and "hash" columns
+        """
+        hashes = self.hash(dataframe)
+        record_ids = dataframe[self.key] if self.key in dataframe else \
+            pandas.Series(None, index=dataframe.index, dtype=object)
+        known = record_ids.notna()
+        stored = self.sql.get_hashes(self.scope) if known.any() else dict()
+        stored = pandas.Series(list(stored.values()), index=list(stored),
+                               dtype=numpy.int64)
+        present = record_ids.isin(stored.index).values
+        changed = numpy.ones(len(dataframe), dtype=bool)
+        changed[present] = stored.loc[record_ids[present]].values != \
+            hashes.values[present]
+        result = dataframe[changed].copy()
+        result["action"] = numpy.where(known.values[changed], "update",
+                                       "insert")
+        result["hash"] = hashes[changed]
+        return result
+
+    def remember(self, dataframe):
+        """
+        STORE THE HASHES OF RECORDS ALREADY IN AIRTABLE (E.G. A FRESH PULL),
+        SO ONLY LATER EDITS ARE SENT.
+        :return: number of hashes stored
+        """
+        hashes = self.hash(dataframe)
+        known = dataframe[self.key].notna()
+        self.sql.set_hashes(self.scope, dict(zip(
+            dataframe[self.key][known], hashes[known])))
+        return int(known.sum())
+
+    @timed("reconcile.push")
+    def push(self, dataframe, dry_run=False, typecast=True):
+        """
+        SEND CHANGED RECORDS TO AIRTABLE AND STORE THEIR NEW HASHES.
+        :param DataFrame dataframe: current records, `key` holding record
+            ids (blank for new records)
+        :param bool dry_run: only compute the diff
+        :return: dict with "diff" (see `diff`), "updated", "inserted",
+            "unchanged" and "errors" counts, and "inserted_ids" (the new
+            record ids, None where the insert failed, in diff order); store
+            those ids or the rows are inserted again on the next push
+        """
+        diff = self.diff(dataframe)
+        report = {"diff": diff, "updated": 0, "inserted": 0,
+                  "unchanged": len(dataframe) - len(diff), "errors": 0,
+                  "inserted_ids": []}
+        incr("reconcile.unchanged", report["unchanged"])
+        if dry_run or diff.empty:
+            return report
+        records = self._records(diff)
+        updates = (diff["action"] == "update").values
+        sent = dict()
+        if updates.any():
+            results = self.airtable.update_many(
+                [{"id": record_id, "fields": fields} for record_id, fields,
+                 update in zip(diff[self.key] if self.key in diff
+                               else [None] * len(diff), records, updates)
+                 if update], typecast=typecast)
+            for record_hash, result in zip(diff["hash"][updates], results):
+                if "error" in result:
+                    report["errors"] += 1
+                else:
+                    sent[result["id"]] = record_hash
+                    report["updated"] += 1
+        if not updates.all():
+            results = self.airtable.insert_many(
+                [fields for fields, update in zip(records, updates)
+                 if not update], typecast=typecast)
+            for record_hash, result in zip(diff["hash"][~updates], results):
+                report["inserted_ids"].append(result.get("id"))
+                if "error" in result:
+                    report["errors"] += 1
+                else:
+                    sent[result["id"]] = record_hash
+                    report["inserted"] += 1
+        self.sql.set_hashes(self.scope, sent)
+        return report
+
+    def _records(self, diff):
+        """FIELD DICTS READY FOR THE API: NULLS AS None, DATES AS TEXT."""
+        fields = diff[self._fields(diff)].copy()
+        for column in fields.columns[fields.dtypes.map(
+                lambda dtype: dtype.kind == "M")]:
+            fields[column] = fields[column].dt.strftime("%Y-%m-%dT%H:%M:%S")
+        fields = fields.astype(object)
+        return fields.where(fields.notna(), None).to_dict(orient="records")
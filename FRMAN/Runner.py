@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+
+"""
+SYNC JOB RUNNER: RUNS A DECLARED GRAPH OF SOURCE -> TRANSFORM -> SINK STEPS
+(config/jobs.yml) WITH INDEPENDENT STEPS IN PARALLEL.
+
+    ./frman --job nightly
+    ./frman --job nightly --workers 8 --dry
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    ThreadPoolExecutor, wait
+from importlib import import_module
+from logging import getLogger
+from os.path import abspath
+from threading import Lock, local
+from time import perf_counter
+
+from FRMAN.Metrics import record
+from FRMAN.Utils import Arguments, jobs_yml, lazy_import, logger, \
+    pretty_print, yml
+
+pandas = lazy_import("pandas")
+
+log = getLogger(__name__)
+
+
+def _resolve(path):
+    """IMPORT "package.module.attribute[.attribute]"."""
+    parts = path.split(".")
+    for split in range(len(parts) - 1, 0, -1):
+        try:
+            target = import_module(".".join(parts[:split]))
+        except ImportError:
+            continue
+        for attribute in parts[split:]:
+            target = getattr(target, attribute)
+        return target
+    raise ImportError("Cannot resolve " + path)
+
+
+def _call(function, frames, kwargs):
+    """RUN A TRANSFORM; MODULE LEVEL SO PROCESS POOLS CAN PICKLE IT."""
+    return _resolve(function)(*frames, **kwargs)
+
+
+class JobRunner:
+    """
+    RUN ONE JOB FROM A JOBS YAML.
+
+    EVERY STEP NAMES ITS `type` AND THE STEPS WHOSE OUTPUT IT READS
+    (`inputs`) OR MUST WAIT FOR (`after`). A STEP STARTS AS SOON AS THOSE
+    FINISH, SO THE JOB TAKES ABOUT AS LONG AS ITS CRITICAL PATH. WRITES TO
+    THE SAME SQLITE FILE ARE SERIALIZED; A FAILED STEP SKIPS ITS DEPENDENTS.
+
+    Example:
+        runner = JobRunner(yml(jobs_yml)["jobs"]["nightly"])
+        results = runner.run()
+        runner.summary()
+    """
+
+    STEP_TYPES = ("airtable", "sheets", "query", "transform", "sql",
+                  "backup", "export")
+
+    def __init__(self, job, config=None, max_workers=4, process_workers=None):
+        """
+        :param dict job: {"steps": {name: step definition}}
+        :param dict config: credentials and defaults, see config/config.yml
+        :param int max_workers: threads running extract and load steps
+        :param int process_workers: processes for transforms declared with
+            `pool: process`, defaults to max_workers
+        """
+        self.steps = dict(job["steps"])
+        self.config = config if config is not None else yml()
+        self.max_workers = max_workers
+        self.process_workers = process_workers or max_workers
+        self.results = dict()
+        self.timings = dict()
+        self.wall_seconds = 0
+        self._processes = None
+        self._databases = dict()
+        self._write_locks = dict()
+        self._lock = Lock()
+        self._local = local()
+        self.order()
+
+    def dependencies(self, name):
+        """STEPS THAT MUST FINISH BEFORE `name` STARTS."""
+        step = self.steps[name]
+        return list(step.get("inputs") or []) + list(step.get("after") or [])
+
+    def order(self):
+        """
+        STEP NAMES IN A VALID RUN ORDER.
+        :raises ValueError: on unknown step types, unknown dependencies or
+            cycles
+        """
+        for name, step in self.steps.items():
+            if step.get("type") not in self.STEP_TYPES:
+                raise ValueError("Step {} has unknown type {}".format(
+                    name, step.get("type")))
+        ordered, visiting = [], set()
+
+        def visit(name, path):
+            if name not in self.steps:
+                raise ValueError("Unknown step {} (needed by {})".format(
+                    name, path[-1] if path else "job"))
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError("Cycle in job graph: " +
+                                 " -> ".join(path + [name]))
+            visiting.add(name)
+            for dependency in self.dependencies(name):
+                visit(dependency, path + [name])
+            ordered.append(name)
+        for name in self.steps:
+            visit(name, [])
+        return ordered
+
+    def run(self):
+        """
+        RUN EVERY STEP.
+        :return: dict of step name -> output (DataFrame or write result)
+        """
+        # STEPS IMPORT PANDAS FROM SEVERAL THREADS AT ONCE, WHICH CAN HIT
+        # IMPORT DEADLOCKS INSIDE PANDAS; LOAD IT HERE FIRST.
+        import pandas  # noqa: F401
+        order = self.order()
+        pending = set(self.steps)
+        running = dict()
+        failed = set()
+        began = perf_counter()
+        with ThreadPoolExecutor(self.max_workers) as threads:
+            while pending or running:
+                # RUN ORDER PUTS DEPENDENCIES FIRST, SO ONE PASS SKIPS EVERY
+                # STEP DOWNSTREAM OF A FAILURE.
+                for name in [name for name in order if name in pending]:
+                    dependencies = self.dependencies(name)
+                    if any(dependency in failed
+                           for dependency in dependencies):
+                        pending.discard(name)
+                        failed.add(name)
+                        self.timings[name] = {"status": "skipped"}
+                        continue
+                    if all(dependency in self.results
+                           for dependency in dependencies):
+                        pending.discard(name)
+                        running[threads.submit(
+                            self._run_step, name, began)] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception:
+                        log.exception("Step %s failed", name)
+                        failed.add(name)
+                        self.timings[name]["status"] = "failed"
+        if self._processes is not None:
+            self._processes.shutdown()
+            self._processes = None
+        self.wall_seconds = perf_counter() - began
+        return self.results
+
+    def _run_step(self, name, began):
+        """RUN ONE STEP AND RECORD ITS TIMING."""
+        step = self.steps[name]
+        frames = [self.results[source] for source in
+                  step.get("inputs") or []]
+        started = perf_counter()
+        self.timings[name] = {"status": "running", "type": step["type"],
+                              "start": started - began}
+        try:
+            result = getattr(self, "_" + step["type"])(step, frames)
+        finally:
+            finished = perf_counter()
+            self.timings[name].update(
+                end=finished - began, seconds=finished - started)
+            record("runner." + name, finished - started)
+        self.timings[name]["status"] = "ok"
+        self.timings[name]["rows"] = len(result) \
+            if hasattr(result, "__len__") else result \
+            if isinstance(result, int) else None
+        log.info("Step %s finished in %.2fs", name,
+                 self.timings[name]["seconds"])
+        return result
+
+    def critical_path(self):
+        """(SECONDS, STEP NAMES) OF THE SLOWEST DEPENDENCY CHAIN."""
+        longest = dict()
+        for name in self.order():
+            seconds = self.timings.get(name, {}).get("seconds") or 0
+            chains = [longest[dependency]
+                      for dependency in self.dependencies(name)]
+            total, path = max(chains, key=lambda chain: chain[0]) \
+                if chains else (0, [])
+            longest[name] = (total + seconds, path + [name])
+        return max(longest.values(), key=lambda chain: chain[0]) \
+            if longest else (0, [])
+
+    def summary(self):
+        """PRINT PER-STEP TIMINGS AND THE WALL/SUM/CRITICAL-PATH TOTALS."""
+        rows = [{"step": name, "type": timing.get("type"),
+                 "status": timing.get("status"),
+                 "start": round(timing.get("start", 0), 2),
+                 "seconds": round(timing.get("seconds", 0), 2),
+                 "rows": timing.get("rows")}
+                for name, timing in sorted(
+                    self.timings.items(),
+                    key=lambda item: item[1].get("start", float("inf")))]
+        pretty_print(pandas.DataFrame(rows), showindex=False)
+        critical_seconds, critical_steps = self.critical_path()
+        print("wall {:.2f}s | sum of steps {:.2f}s | critical path {:.2f}s "
+              "({})".format(self.wall_seconds,
+                            sum(timing.get("seconds", 0)
+                                for timing in self.timings.values()),
+                            critical_seconds, " -> ".join(critical_steps)))
+
+    def database(self, db_file=None):
+        """
+        RETURN (SQL, WRITE LOCK) SHARED BY EVERY STEP USING `db_file`.
+        """
+        from FRMAN.SQL import SQL
+        db_file = db_file or self.config["sql"]["db_file"]
+        key = abspath(db_file)
+        with self._lock:
+            if key not in self._databases:
+                self._databases[key] = SQL(db_file)
+                self._write_locks[key] = Lock()
+            return self._databases[key], self._write_locks[key]
+
+    def sheets(self):
+        """RETURN THIS THREAD'S Sheets CLIENT."""
+        from FRMAN.Sheets import Sheets
+        if getattr(self._local, "sheets", None) is None:
+            settings = self.config["google_sheets"]
+            self._local.sheets = Sheets(settings["token"],
+                                        settings["client_secret"])
+        return self._local.sheets
+
+    def _airtable(self, step, frames):
+        """SOURCE: AN AIRTABLE TABLE (base/api_key DEFAULT TO config.yml)."""
+        from FRMAN.Airtable import Airtable
+        settings = self.config.get("airtable") or {}
+        airtable = Airtable(step.get("base") or settings["base"],
+                            step["table"],
+                            step.get("api_key") or settings["api_key"],
+                            api_url=step.get("api_url") or
+                            settings.get("api_url"))
+        return airtable.get_airtable_raw(
+            params=step.get("params"), fields=step.get("fields"),
+            view=step.get("view"), sort=step.get("sort"),
+            max_records=step.get("max_records"))
+
+    def _sheets(self, step, frames):
+        """SOURCE: A WORKSHEET (sheet_id DEFAULTS TO config.yml)."""
+        return self.sheets().sheet_to_df(
+            step.get("sheet_id") or
+            self.config["google_sheets"]["sheet_id"],
+            sheet_name=step.get("sheet_name"),
+            sheet_range=step.get("sheet_range"))
+
+    def _query(self, step, frames):
+        """SOURCE: A SELECT AGAINST A SQLITE DATABASE."""
+        sql, _ = self.database(step.get("db_file"))
+        return sql.read_sql(step["query"])
+
+    def _transform(self, step, frames):
+        """
+        TRANSFORM: `function(*input_frames, **kwargs)`. `load` MAPS KEYWORD
+        ARGUMENTS TO YAML FILES PASSED PARSED. `pool: process` RUNS IT IN A
+        WORKER PROCESS.
+        """
+        kwargs = dict(step.get("kwargs") or {})
+        for argument, file_path in (step.get("load") or {}).items():
+            kwargs[argument] = yml(file_path)
+        if step.get("pool") == "process":
+            with self._lock:
+                if self._processes is None:
+                    self._processes = ProcessPoolExecutor(
+                        self.process_workers)
+            return self._processes.submit(
+                _call, step["function"], frames, kwargs).result()
+        return _call(step["function"], frames, kwargs)
+
+    def _sql(self, step, frames):
+        """
+        SINK: INGEST THE INPUT FRAME INTO SQLITE, ONE WRITER PER DATABASE.
+        `key` UPSERTS INSTEAD OF APPENDING.
+        """
+        sql, write_lock = self.database(step.get("db_file"))
+        with write_lock:
+            return sql.ingest_df(frames[0], step["table"],
+                                 if_exists=step.get("if_exists", "append"),
+                                 careful=step.get("key") is not None,
+                                 key=step.get("key"))
+
+    def _backup(self, step, frames):
+        """SINK: BACK THE INPUT FRAME UP TO A WORKSHEET."""
+        return self.sheets().backup_to_sheet(
+            step.get("sheet_id") or
+            self.config["google_sheets"]["sheet_id"],
+            frames[0].copy(), sheet_name=step.get("sheet_name"),
+            key=step.get("key"))
+
+    def _export(self, step, frames):
+        """SINK: STREAM A QUERY TO A FILE WITH `SQL.export`."""
+        sql, _ = self.database(step.get("db_file"))
+        return sql.export(step["query"], step["file_path"])
+
+
+def main():
+    """`frman` COMMAND LINE ENTRY POINT."""
+    arguments = Arguments({
+        "application": "frman",
+        "version": "1.0",
+        "description": "Run a FRMAN sync job from config/jobs.yml",
+        "arguments": [
+            {"arg": "job", "action": "store", "dest": "job",
+             "default": "nightly", "help": "Job name"},
+            {"arg": "file", "action": "store", "dest": "file",
+             "default": jobs_yml, "help": "Jobs YAML file"},
+            {"arg": "workers", "action": "store", "dest": "workers",
+             "default": 4, "help": "Parallel steps"},
+            {"arg": "dry", "action": "store_true", "dest": "dry",
+             "default": False, "help": "Print the run order and exit"},
+        ]}).parse()
+    logger(level="info", timestamp=True)
+    runner = JobRunner(yml(arguments["file"])["jobs"][arguments["job"]],
+                       max_workers=int(arguments["workers"]))
+    if arguments["dry"]:
+        for name in runner.order():
+            print(name, "<-", ", ".join(runner.dependencies(name)) or "-")
+        return 0
+    runner.run()
+    runner.summary()
+    return int(any(timing.get("status") != "ok"
+                   for timing in runner.timings.values()))
+
+
+if __name__ == "__main__":
+    exit(main())
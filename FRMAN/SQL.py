@@ -6,95 +6,558 @@
 COMMUNICATION WITH SQLITE DB.
 """
 
-from pandas import DataFrame
-from pandas import read_sql as _read_sql
-from sqlalchemy import create_engine
+from collections import OrderedDict
+from contextlib import contextmanager
+from logging import getLogger
+from re import IGNORECASE, compile, sub
+from threading import Lock
+
+from FRMAN.Metrics import incr, timed
+from FRMAN.Utils import lazy_import, yml
+
+pandas = lazy_import("pandas")
+log = getLogger(__name__)
+
+_PRAGMA_NAME = compile(r"^[A-Za-z_]+$")
+_WRITE_TARGET = compile(
+    r"\b(?:INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM|"
+    r"(?:DROP|ALTER|CREATE)\s+TABLE(?:\s+IF(?:\s+NOT)?\s+EXISTS)?)"
+    r"\s+[\"`\[]?(\w+)", IGNORECASE)
+_WORD = compile(r"\w+")
+_EXPORT_FORMATS = ("csv.gz", "csv.zst", "csv", "parquet", "xlsx")
+_XLSX_MAX_ROWS = 1048576
+
+
+def _quote(identifier):
+    """QUOTE A TABLE OR COLUMN NAME FOR SQLITE."""
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _sqlite_type(dtype):
+    """SQLITE COLUMN TYPE FOR A PANDAS DTYPE, AS `to_sql` WOULD PICK."""
+    return {"b": "INTEGER", "i": "INTEGER", "u": "INTEGER", "f": "REAL",
+            "M": "TIMESTAMP"}.get(getattr(dtype, "kind", "O"), "TEXT")
 
 
 class SQL:
     """Main SQL Class."""
 
-    def __init__(self, db_file):
-        """RETURN SQLITE ENGINE."""
+    SYNC_TABLE = "_frman_sync"
+    HASH_TABLE = "_frman_hashes"
+    _MISSING = object()
+
+    def __init__(self, db_file, pragmas=None, pool_size=5, cache_size=128,
+                 schema=None):
+        """
+        RETURN SQLITE ENGINE.
+
+        CONNECTIONS ARE POOLED AND EVERY NEW CONNECTION IS TUNED WITH
+        `pragmas` (DEFAULTS TO `sql.pragmas` IN config/config.yml), E.G.
+        {"journal_mode": "WAL", "synchronous": "NORMAL"}.
+        :param str db_file: path to the sqlite database
+        :param dict pragmas: PRAGMA name/value pairs set on connect
+        :param int pool_size: connections kept open in the pool
+        :param int cache_size: `get_dict`/`get_var` results kept in the
+            lookup cache, 0 to disable it
+        :param SchemaRegistry schema: declared tables, defaults to
+            config/schema.yml; False leaves every table to `to_sql`
+        """
+        if pragmas is None:
+            pragmas = (yml().get("sql") or {}).get("pragmas") or {}
+        for name in pragmas:
+            if not _PRAGMA_NAME.match(str(name)):
+                raise ValueError("Invalid PRAGMA name: " + str(name))
+        self.pragmas = dict(pragmas)
+        from sqlalchemy import create_engine, event
+        from sqlalchemy.pool import QueuePool
         db_uri = "sqlite:///" + db_file
-        engine = create_engine(db_uri)
+        engine = create_engine(db_uri, poolclass=QueuePool,
+                               pool_size=pool_size,
+                               connect_args={"check_same_thread": False})
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "begin", self._on_begin)
         self.engine = engine
+        self._conn = None
+        self.cache_size = cache_size
+        self._lookups = OrderedDict()
+        self._lookups_lock = Lock()
+        self._generation = 0
+        if schema is None:
+            from FRMAN.Schema import SchemaRegistry
+            schema = SchemaRegistry()
+        self.schema = schema or None
+        self._migrated = set()
+        self._plans_checked = set()
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        """
+        APPLY PRAGMAS AND LET SQLALCHEMY, NOT PYSQLITE, EMIT BEGIN SO
+        TRANSACTIONS COVER DDL AND SPAN EVERY STATEMENT INSIDE THEM.
+        """
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            cursor.execute("PRAGMA {} = {}".format(name, value))
+        cursor.close()
+
+    @staticmethod
+    def _on_begin(conn):
+        """EMIT BEGIN FOR EXPLICIT TRANSACTIONS."""
+        conn.execute("BEGIN")
+
+    def connect(self):
+        """
+        OPEN A LONG-LIVED CONNECTION SHARED BY EVERY METHOD UNTIL `close`.
+        NOT THREAD-SAFE: USE ONE SQL OBJECT PER THREAD IN THIS MODE.
+        """
+        if self._conn is None:
+            self._conn = self.engine.connect()
+        return self
+
+    def close(self):
+        """CLOSE THE LONG-LIVED CONNECTION, IF ANY."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        RUN EVERY SQL CALL IN THE BLOCK INSIDE ONE TRANSACTION.
+        COMMITS ON SUCCESS AND ROLLS BACK ON ERROR.
+
+        Example:
+            with sql.transaction():
+                sql.delete("requests", "rec123", "id")
+                sql.ingest_df(dataframe, "requests")
+        """
+        opened = self._conn is None
+        self.connect()
+        try:
+            with self._conn.begin():
+                yield self
+        except BaseException:
+            self.invalidate()
+            raise
+        finally:
+            if opened:
+                self.close()
+
+    @contextmanager
+    def _connection(self):
+        """YIELD THE LONG-LIVED CONNECTION OR A POOLED ONE FOR ONE CALL."""
+        if self._conn is not None:
+            yield self._conn
+        else:
+            conn = self.engine.connect()
+            try:
+                yield conn
+            finally:
+                conn.close()
 
+    @timed("sql.ingest_df")
     def ingest_df(self, dataframe, table_name, if_exists="append",
                   careful=False, key=None):
         """
         INGEST DATAFRAME TO SQLITE DB.
+
+        WHEN `careful` IS SET ALONGSIDE A `key` (A COLUMN NAME OR A LIST OF
+        COLUMN NAMES) ROWS ARE UPSERTED WITH `upsert_df` INSTEAD OF APPENDED.
+        TABLES DECLARED IN THE SCHEMA REGISTRY ARE CREATED WITH THEIR TYPES,
+        KEYS AND INDEXES, AND "replace" EMPTIES THEM INSTEAD OF DROPPING.
         """
         if not dataframe.empty:
-            conn = self.engine.connect()
-            if careful is True and key is not None:
-                for index, row in dataframe.iterrows():
-                    delete = "DELETE FROM " + table_name + \
-                             " WHERE " + key + " = '" + str(row[key]) + "'"
-                    conn.execute(delete)
-            dataframe.to_sql(table_name, con=conn,
-                             if_exists=if_exists, index=False)
-            conn.close()
+            if careful is True and key is not None and if_exists == "append":
+                self.upsert_df(dataframe, table_name, key)
+            elif self._managed(table_name):
+                if if_exists not in ("fail", "replace", "append"):
+                    raise ValueError(
+                        "'{}' is not valid for if_exists".format(if_exists))
+                with self._connection() as conn:
+                    with conn.begin():
+                        if if_exists == "fail" and \
+                                self.engine.dialect.has_table(
+                                    conn, table_name):
+                            raise ValueError("Table '{}' already exists."
+                                             .format(table_name))
+                        self._migrate(conn, table_name, dataframe)
+                        if if_exists == "replace":
+                            conn.execute("DELETE FROM " + _quote(table_name))
+                        dataframe.to_sql(table_name, con=conn,
+                                         if_exists="append", index=False)
+                self.invalidate(table_name)
+                incr("sql.rows_written", len(dataframe))
+            else:
+                with self._connection() as conn:
+                    dataframe.to_sql(table_name, con=conn,
+                                     if_exists=if_exists, index=False)
+                self.invalidate(table_name)
+                incr("sql.rows_written", len(dataframe))
             length = len(dataframe)
         else:
             length = 0
         return length
 
+    @timed("sql.upsert_df")
+    def upsert_df(self, dataframe, table_name, key):
+        """
+        UPSERT DATAFRAME INTO SQLITE TABLE BY ONE OR MORE KEY COLUMNS.
+
+        THE DATAFRAME IS STAGED WITH A SINGLE BULK INSERT INTO A TEMP TABLE
+        (KEPT IN MEMORY BY THE DEFAULT `temp_store` PRAGMA), MATCHING ROWS ARE
+        DELETED FROM THE TARGET WITH ONE JOIN AND THE STAGED ROWS ARE COPIED
+        OVER, ALL INSIDE ONE TRANSACTION. COLUMNS MISSING FROM THE TARGET
+        ARE ADDED FIRST.
+        :param DataFrame dataframe: rows to write
+        :param str table_name: target table
+        :param key: key column name, or a list of names for a composite key
+        :return: dict with "inserted" and "updated" row counts
+        """
+        counts = {"inserted": 0, "updated": 0}
+        if dataframe.empty:
+            return counts
+        keys = [key] if isinstance(key, str) else list(key)
+        missing = [column for column in keys if column not in dataframe]
+        if missing:
+            raise KeyError("Key columns not in dataframe: " + str(missing))
+        target = _quote(table_name)
+        stage_name = "_frman_stage_" + table_name.lower()
+        staging = _quote(stage_name)
+        columns = ", ".join(_quote(column) for column in dataframe.columns)
+        match = " AND ".join(
+            "{staging}.{column} = {target}.{column}".format(
+                staging=staging, target=target, column=_quote(column))
+            for column in keys)
+        incr("sql.rows_written", len(dataframe))
+        with self._connection() as conn:
+            if self._managed(table_name):
+                with conn.begin():
+                    self._migrate(conn, table_name)
+            if not self.engine.dialect.has_table(conn, table_name):
+                dataframe.to_sql(table_name, con=conn, index=False)
+                self.invalidate(table_name)
+                counts["inserted"] = len(dataframe)
+                return counts
+            with conn.begin():
+                self._stage(conn, stage_name, dataframe)
+                existing = self._columns(conn, table_name)
+                for column, column_type in self._columns(
+                        conn, stage_name).items():
+                    if column not in existing:
+                        conn.execute("ALTER TABLE " + target +
+                                     " ADD COLUMN " + _quote(column) +
+                                     " " + column_type)
+                count = "SELECT COUNT(*) FROM " + staging + " WHERE EXISTS " \
+                    "(SELECT 1 FROM " + target + " WHERE " + match + ")"
+                self._check_plan(conn, count, table_name)
+                updated = conn.execute(count).scalar()
+                conn.execute(
+                    "DELETE FROM " + target + " WHERE rowid IN "
+                    "(SELECT " + target + ".rowid FROM " + staging +
+                    " JOIN " + target + " ON " + match + ")")
+                conn.execute(
+                    "INSERT INTO " + target + " (" + columns + ") "
+                    "SELECT " + columns + " FROM " + staging)
+                conn.execute("DROP TABLE temp." + staging)
+        self.invalidate(table_name)
+        counts["updated"] = updated
+        counts["inserted"] = len(dataframe) - updated
+        return counts
+
+    @timed("sql.delete_missing")
+    def delete_missing(self, table_name, column, keep):
+        """
+        DELETE ROWS WHOSE `column` VALUE IS NOT IN `keep`, USING ONE
+        ANTI-JOIN AGAINST A STAGED COPY OF THE KEPT VALUES.
+        :return: number of rows deleted
+        """
+        stage_name = "_frman_keep_" + table_name.lower()
+        staging = _quote(stage_name)
+        with self._connection() as conn:
+            if not self.engine.dialect.has_table(conn, table_name):
+                return 0
+            with conn.begin():
+                self._stage(conn, stage_name,
+                            pandas.DataFrame({column: list(keep)}))
+                result = conn.execute(
+                    "DELETE FROM " + _quote(table_name) + " WHERE " +
+                    _quote(column) + " NOT IN (SELECT " + _quote(column) +
+                    " FROM " + staging + ")")
+                deleted = result.rowcount
+                conn.execute("DROP TABLE temp." + staging)
+        self.invalidate(table_name)
+        return deleted
+
+    @staticmethod
+    def _stage(conn, stage_name, dataframe):
+        """
+        COPY A DATAFRAME INTO A FRESH TEMP TABLE, KEPT IN MEMORY BY THE
+        DEFAULT `temp_store` PRAGMA AND VISIBLE ONLY TO `conn`.
+        """
+        staging = _quote(stage_name)
+        conn.execute("DROP TABLE IF EXISTS temp." + staging)
+        conn.execute("CREATE TEMP TABLE " + staging + " (" + ", ".join(
+            _quote(column) + " " + _sqlite_type(dtype)
+            for column, dtype in dataframe.dtypes.items()) + ")")
+        dataframe.to_sql(stage_name, con=conn, if_exists="append",
+                         index=False)
+
+    def get_watermark(self, name):
+        """
+        GET THE SYNC HIGH-WATER MARK STORED FOR `name`, OR NONE.
+        """
+        with self._connection() as conn:
+            if not self.engine.dialect.has_table(conn, self.SYNC_TABLE):
+                return None
+            result = conn.execute(
+                "SELECT watermark FROM " + self.SYNC_TABLE +
+                " WHERE name = ?", (name,)).fetchone()
+        return None if result is None else result[0]
+
+    def set_watermark(self, name, watermark):
+        """
+        STORE THE SYNC HIGH-WATER MARK FOR `name`.
+        """
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS " + self.SYNC_TABLE +
+                         " (name TEXT PRIMARY KEY, watermark TEXT,"
+                         " synced_at TEXT)")
+            conn.execute("INSERT OR REPLACE INTO " + self.SYNC_TABLE +
+                         " (name, watermark, synced_at)"
+                         " VALUES (?, ?, datetime('now'))",
+                         (name, watermark))
+
+    def get_hashes(self, scope, record_ids=None):
+        """
+        GET THE STORED CONTENT HASHES FOR `scope` (E.G. "base.table").
+        :param list record_ids: only these records, default all
+        :return: dict of record id -> hash
+        """
+        with self._connection() as conn:
+            if not self.engine.dialect.has_table(conn, self.HASH_TABLE):
+                return dict()
+            query = "SELECT record_id, hash FROM " + self.HASH_TABLE + \
+                " WHERE scope = ?"
+            if record_ids is None:
+                rows = conn.execute(query, (scope,)).fetchall()
+            else:
+                record_ids = list(record_ids)
+                rows = []
+                for start in range(0, len(record_ids), 500):
+                    batch = record_ids[start:start + 500]
+                    rows.extend(conn.execute(
+                        query + " AND record_id IN (" +
+                        ", ".join("?" * len(batch)) + ")",
+                        [scope] + batch).fetchall())
+        return {row[0]: row[1] for row in rows}
+
+    def set_hashes(self, scope, hashes):
+        """
+        STORE CONTENT HASHES FOR `scope`.
+        :param dict hashes: record id -> signed 64-bit hash
+        """
+        with self._connection() as conn:
+            with conn.begin():
+                conn.execute("CREATE TABLE IF NOT EXISTS " + self.HASH_TABLE +
+                             " (scope TEXT, record_id TEXT, hash INTEGER,"
+                             " synced_at TEXT, PRIMARY KEY (scope, record_id))")
+                if hashes:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO " + self.HASH_TABLE +
+                        " (scope, record_id, hash, synced_at)"
+                        " VALUES (?, ?, ?, datetime('now'))",
+                        [(scope, record_id, int(value))
+                         for record_id, value in hashes.items()])
+
+    @staticmethod
+    def _columns(conn, table_name):
+        """RETURN {COLUMN: DECLARED TYPE} FOR A TABLE."""
+        return {row[1]: row[2] for row in conn.execute(
+            "PRAGMA table_info(" + _quote(table_name) + ")")}
+
+    def _managed(self, table_name):
+        """WHETHER `table_name` IS DECLARED IN THE SCHEMA REGISTRY."""
+        return self.schema is not None and table_name in self.schema
+
+    def _migrate(self, conn, table_name, dataframe=None):
+        """
+        APPLY THE DECLARED SCHEMA OF A TABLE (ONCE PER SQL OBJECT), THEN ADD
+        ANY `dataframe` COLUMNS IT STILL LACKS WITH THEIR INFERRED TYPES.
+        """
+        if table_name.lower() not in self._migrated:
+            self.schema.apply(conn, table_name)
+            self._migrated.add(table_name.lower())
+        if dataframe is not None:
+            existing = self._columns(conn, table_name)
+            for column, dtype in dataframe.dtypes.items():
+                if column not in existing:
+                    conn.execute("ALTER TABLE " + _quote(table_name) +
+                                 " ADD COLUMN " + _quote(column) + " " +
+                                 _sqlite_type(dtype))
+
+    def migrate(self):
+        """
+        CREATE OR ADDITIVELY MIGRATE EVERY TABLE IN THE SCHEMA REGISTRY.
+        :return: dict of table -> statements executed
+        """
+        applied = dict()
+        if self.schema is None:
+            return applied
+        with self._connection() as conn:
+            with conn.begin():
+                for table_name, _ in self.schema.tables.values():
+                    applied[table_name] = self.schema.apply(conn, table_name)
+                    self._migrated.add(str(table_name).lower())
+        self.invalidate()
+        return applied
+
+    def _check_plan(self, conn, statement, table_name):
+        """
+        WARN, ONCE PER STATEMENT SHAPE, WHEN SQLITE WOULD FILTER
+        `table_name` WITH A FULL SCAN OR A THROWAWAY AUTOMATIC INDEX.
+        """
+        shape = sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", "?", statement)
+        if shape in self._plans_checked:
+            return
+        self._plans_checked.add(shape)
+        name = str(table_name).strip('"').lower()
+        for row in conn.execute("EXPLAIN QUERY PLAN " + statement):
+            detail = str(row[-1])
+            words = detail.replace(" TABLE ", " ").split()
+            if len(words) < 2 or words[1].lower() != name:
+                continue
+            if "AUTOMATIC" in detail or \
+                    (words[0] == "SCAN" and "INDEX" not in detail):
+                log.warning("Unindexed filter on %s, declare an index in "
+                            "config/schema.yml: %s", table_name, shape)
+                return
+
+    @timed("sql.read_sql")
     def read_sql(self, query: object) -> object:
         """
         SELECT * FROM SQLITE TABLE INTO DF.
         """
-        conn = self.engine.connect()
-        dataframe = _read_sql(query, con=conn)
-        conn.close()
+        with self._connection() as conn:
+            dataframe = pandas.read_sql(query, con=conn)
+        incr("sql.rows_read", len(dataframe))
         return dataframe
 
+    def read_sql_chunks(self, query, chunksize=10000, dtype=None, raw=False):
+        """
+        STREAM A QUERY IN CHUNKS INSTEAD OF ONE DATAFRAME.
+
+        ROWS ARE PULLED FROM THE CURSOR `chunksize` AT A TIME, SO ONLY ONE
+        CHUNK IS HELD IN MEMORY. THE CONNECTION STAYS OPEN UNTIL THE
+        GENERATOR IS EXHAUSTED OR CLOSED.
+
+        Example:
+            for chunk in sql.read_sql_chunks("SELECT * FROM requests"):
+                transform(chunk)
+        :param str query: the SELECT statement
+        :param int chunksize: rows per chunk
+        :param dtype: dtype, or dict of column -> dtype, applied per chunk
+        :param bool raw: yield (columns, rows) tuples instead of DataFrames
+        :return: generator of DataFrames, or of (columns, list of rows)
+        """
+        stream = self._stream(query, chunksize)
+        try:
+            columns = next(stream)
+            for rows in stream:
+                if raw:
+                    yield columns, rows
+                    continue
+                dataframe = pandas.DataFrame.from_records(
+                    rows, columns=columns)
+                if dtype is not None:
+                    dataframe = dataframe.astype(dtype, copy=False)
+                yield dataframe
+        finally:
+            stream.close()
+
+    def _stream(self, query, chunksize):
+        """YIELD THE RESULT COLUMNS, THEN LISTS OF UP TO `chunksize` ROWS."""
+        with self._connection() as conn:
+            result = conn.execution_options(stream_results=True) \
+                .execute(query)
+            try:
+                yield list(result.keys())
+                while True:
+                    rows = result.fetchmany(chunksize)
+                    if not rows:
+                        break
+                    incr("sql.rows_read", len(rows))
+                    yield [tuple(row) for row in rows]
+            finally:
+                result.close()
+
+    @timed("sql.vacuum")
     def vacuum(self):
         """
         VACUUM SQLITE DATABASE.
         """
-        conn = self.engine.connect()
-        conn.execute("VACUUM")
-        conn.close()
+        with self._connection() as conn:
+            conn.execute("VACUUM")
 
-    def get_var(self, table, var, where=None):
+    @timed("sql.get_var")
+    def get_var(self, table, var, where=None, cache=True):
         """
-        GET VARIABLE FROM SQL DATABASE.
+        GET VARIABLE FROM SQL DATABASE. RESULTS ARE KEPT IN THE LOOKUP CACHE
+        UNTIL `table` IS WRITTEN THROUGH THIS OBJECT.
         """
-        conn = self.engine.connect()
         if where is None:
             where = "1=1"
         if "MAX" not in var:
             var = '"' + var + '"'
         where_statement = "SELECT DISTINCT " + \
                           var + " FROM " + table + " WHERE " + where
-        result = conn.execute(where_statement)
-        try:
-            variable = result.fetchone()[0]
-        except TypeError as e:
-            print(e)
-            variable = None
-        conn.close()
-        return variable
 
+        def build():
+            with self._connection() as conn:
+                if where != "1=1":
+                    self._check_plan(conn, where_statement, table)
+                result = conn.execute(where_statement)
+                try:
+                    variable = result.fetchone()[0]
+                except TypeError as e:
+                    print(e)
+                    variable = None
+            return variable
+        if not cache:
+            return build()
+        return self._lookup(table, ("var", var, where), build)
+
+    @timed("sql.delete")
     def delete(self, table, key, column):
         """
         DELETE DATA FROM SQL DATABASE.
         """
-        conn = self.engine.connect()
         key = "'" + key + "'"
         delete = "DELETE FROM " + table + ' WHERE ' + column + \
                  " = " + str(key)
-        conn.execute(delete)
-        conn.close()
+        with self._connection() as conn:
+            self._check_plan(conn, delete, table)
+            conn.execute(delete)
+        self.invalidate(table)
 
+    @timed("sql.execute")
     def execute(self, statement):
         """
-        EXECUTE STATEMENT ON DATABASE.
+        EXECUTE STATEMENT ON DATABASE. CACHED LOOKUPS ON THE TABLES IT
+        WRITES ARE DROPPED (ALL OF THEM IF NO TABLE CAN BE TOLD).
         """
-        conn = self.engine.connect()
-        conn.execute(statement)
-        conn.close()
+        with self._connection() as conn:
+            conn.execute(statement)
+        tables = _WRITE_TARGET.findall(str(statement))
+        if not tables:
+            self.invalidate()
+        for table in tables:
+            self.invalidate(table)
 
     @staticmethod
     def to_csv(dataframe, file_path, header=True, index=False, delimiter=",",
@@ -106,19 +569,208 @@ class SQL:
                          encoding=encoding, quotechar=quotechar,
                          quoting=quoting)
 
-    def get_dict(self, table, key, value, data=False):
+    @timed("sql.export")
+    def export(self, query, file_path, file_format=None, chunksize=10000,
+               header=True, delimiter=",", encoding="utf-8", quotechar='"',
+               quoting=1, sheet_name="Sheet1"):
+        """
+        STREAM A QUERY STRAIGHT TO A FILE, `chunksize` ROWS AT A TIME.
+
+        THE FORMAT FOLLOWS THE EXTENSION: .csv, .csv.gz, .csv.zst (NEEDS
+        zstandard), .parquet (NEEDS pyarrow) OR .xlsx (xlsxwriter IN
+        CONSTANT-MEMORY MODE, STARTING A NEW SHEET EVERY 1,048,575 ROWS).
+        CSV DEFAULTS MATCH `to_csv`, EXCEPT THAT VALUES ARE WRITTEN AS
+        STORED: AN INTEGER COLUMN HOLDING NULLS STAYS "1", NOT "1.0". AN
+        EMPTY RESULT STILL WRITES THE HEADER (OR PARQUET SCHEMA).
+
+        Example:
+            sql.export("SELECT * FROM requests", "requests.csv.gz")
+        :param str query: the SELECT statement
+        :param str file_path: destination file
+        :param str file_format: "csv", "csv.gz", "csv.zst", "parquet" or
+            "xlsx", to override the extension
+        :param int chunksize: rows fetched and written per batch
+        :return: number of rows written
+        """
+        if file_format is None:
+            lowered = file_path.lower()
+            file_format = next((extension for extension in _EXPORT_FORMATS
+                                if lowered.endswith("." + extension)), None)
+        if file_format not in _EXPORT_FORMATS:
+            raise ValueError("Unsupported export format: " + str(file_format))
+        stream = self._stream(query, chunksize)
+        try:
+            columns = next(stream)
+            if file_format == "parquet":
+                return self._export_parquet(columns, stream, file_path)
+            if file_format == "xlsx":
+                return self._export_xlsx(columns, stream, file_path, header,
+                                         sheet_name)
+            return self._export_csv(columns, stream, file_path, file_format,
+                                    header, delimiter, encoding, quotechar,
+                                    quoting)
+        finally:
+            stream.close()
+
+    @staticmethod
+    def _export_csv(columns, chunks, file_path, file_format, header,
+                    delimiter, encoding, quotechar, quoting):
+        """WRITE ROW CHUNKS AS (OPTIONALLY COMPRESSED) CSV."""
+        from csv import writer
+        from os import linesep
+        if file_format == "csv.gz":
+            from gzip import open as gzip_open
+            output = gzip_open(file_path, "wt", encoding=encoding,
+                               newline="")
+        elif file_format == "csv.zst":
+            from io import TextIOWrapper
+            from zstandard import ZstdCompressor
+            output = TextIOWrapper(
+                ZstdCompressor().stream_writer(open(file_path, "wb")),
+                encoding=encoding, newline="")
+        else:
+            output = open(file_path, "w", encoding=encoding, newline="")
+        length = 0
+        with output:
+            csv_writer = writer(output, delimiter=delimiter,
+                                quotechar=quotechar, quoting=quoting,
+                                lineterminator=linesep)
+            if header:
+                csv_writer.writerow(columns)
+            for rows in chunks:
+                csv_writer.writerows(rows)
+                length += len(rows)
+        return length
+
+    @staticmethod
+    def _export_parquet(columns, chunks, file_path):
+        """
+        WRITE ROW CHUNKS AS ONE PARQUET ROW GROUP EACH. THE SCHEMA IS TAKEN
+        FROM THE FIRST CHUNK, WITH ALL-NULL COLUMNS TYPED AS STRINGS; AN
+        EMPTY RESULT GETS AN ALL-STRING SCHEMA.
+        """
+        import pyarrow
+        from pyarrow import parquet
+        parquet_writer = None
+        length = 0
+        try:
+            for rows in chunks:
+                dataframe = pandas.DataFrame.from_records(rows,
+                                                          columns=columns)
+                if parquet_writer is None:
+                    schema = pyarrow.Schema.from_pandas(
+                        dataframe, preserve_index=False)
+                    for position, field in enumerate(schema):
+                        if pyarrow.types.is_null(field.type):
+                            schema = schema.set(position, pyarrow.field(
+                                field.name, pyarrow.string()))
+                    parquet_writer = parquet.ParquetWriter(file_path, schema)
+                parquet_writer.write_table(pyarrow.Table.from_pandas(
+                    dataframe, schema=schema, preserve_index=False))
+                length += len(dataframe)
+            if parquet_writer is None:
+                parquet_writer = parquet.ParquetWriter(
+                    file_path, pyarrow.schema([
+                        pyarrow.field(str(column), pyarrow.string())
+                        for column in columns]))
+        finally:
+            if parquet_writer is not None:
+                parquet_writer.close()
+        return length
+
+    @staticmethod
+    def _export_xlsx(columns, chunks, file_path, header, sheet_name):
+        """WRITE ROW CHUNKS ROW BY ROW WITH xlsxwriter IN CONSTANT MEMORY."""
+        from xlsxwriter import Workbook
+        workbook = Workbook(file_path, {"constant_memory": True,
+                                        "strings_to_formulas": False,
+                                        "strings_to_urls": False,
+                                        "nan_inf_to_errors": True})
+        worksheet = None
+        sheets = 0
+        row_number = 0
+        length = 0
+        with workbook:
+            for rows in chunks:
+                for row in rows:
+                    if worksheet is None or row_number == _XLSX_MAX_ROWS:
+                        sheets += 1
+                        worksheet = workbook.add_worksheet(
+                            sheet_name if sheets == 1 else
+                            "{} ({})".format(sheet_name, sheets))
+                        row_number = 0
+                        if header:
+                            worksheet.write_row(0, 0, columns)
+                            row_number = 1
+                    worksheet.write_row(row_number, 0, row)
+                    row_number += 1
+                length += len(rows)
+            if worksheet is None:
+                worksheet = workbook.add_worksheet(sheet_name)
+                if header:
+                    worksheet.write_row(0, 0, columns)
+        return length
+
+    @timed("sql.get_dict")
+    def get_dict(self, table, key, value, data=False, cache=True):
         """
         GET DICTIONARY FROM DATAFRAME WITH 2 KEY, VALUE COLUMNS.
+
+        READ FROM THE TABLE, THE MAP IS BUILT STRAIGHT FROM THE CURSOR AND
+        KEPT IN THE LOOKUP CACHE UNTIL `table` IS WRITTEN THROUGH THIS
+        OBJECT; TREAT THE RETURNED DICT AS READ-ONLY.
         """
-        if data is False:
-            conn = self.engine.connect()
-            dataframe = _read_sql(
-                "SELECT {}, {} FROM {}".format(key, value, table), con=conn)
-            conn.close()
-        elif type(data) == DataFrame:
-            dataframe = data
-        dataframe.set_index(key, inplace=True)
-        df_dict = dataframe.to_dict(orient="index")
-        for key, item in df_dict.items():
-            df_dict[key] = item[value]
-        return df_dict
+        if data is not False:
+            return dict(zip(data[key], data[value]))
+
+        def build():
+            with self._connection() as conn:
+                result = conn.execute(
+                    "SELECT {}, {} FROM {}".format(key, value, table))
+                return {row[0]: row[1] for row in result}
+        if not cache:
+            return build()
+        return self._lookup(table, ("dict", key, value), build)
+
+    def _lookup(self, table, query, build):
+        """
+        RETURN THE CACHED RESULT OF `query` ON `table`, CALLING `build` ON A
+        MISS AND EVICTING THE LEAST RECENTLY USED ENTRY PAST `cache_size`.
+        A RESULT BUILT WHILE AN INVALIDATION RAN IS RETURNED, NOT CACHED.
+        """
+        if self.cache_size <= 0:
+            return build()
+        cache_key = (table, query)
+        with self._lookups_lock:
+            result = self._lookups.get(cache_key, self._MISSING)
+            if result is not self._MISSING:
+                self._lookups.move_to_end(cache_key)
+            generation = self._generation
+        if result is not self._MISSING:
+            incr("sql.cache_hits")
+            return result
+        incr("sql.cache_misses")
+        result = build()
+        with self._lookups_lock:
+            if generation != self._generation:
+                return result
+            self._lookups[cache_key] = result
+            while len(self._lookups) > self.cache_size:
+                self._lookups.popitem(last=False)
+        return result
+
+    def invalidate(self, table=None):
+        """
+        DROP CACHED `get_dict`/`get_var` RESULTS READ FROM `table` (EVERY
+        RESULT IF NONE). CALL AFTER WRITING THE DATABASE OUTSIDE THIS OBJECT.
+        """
+        with self._lookups_lock:
+            self._generation += 1
+            if table is None:
+                self._lookups.clear()
+                return
+            name = str(table).strip('"`[]').lower()
+            for cache_key in list(self._lookups):
+                if name in (word.lower()
+                            for word in _WORD.findall(cache_key[0])):
+                    del self._lookups[cache_key]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+DECLARED SQLITE TABLE SCHEMAS (config/schema.yml).
+"""
+
+from logging import getLogger
+from os.path import exists
+from re import sub
+
+from FRMAN.SQL import _quote
+from FRMAN.Utils import schema_yml, yml
+
+log = getLogger(__name__)
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value or [])
+
+
+class SchemaRegistry:
+    """
+    TABLE DEFINITIONS WITH TYPED COLUMNS, PRIMARY KEYS AND INDEXES,
+    APPLIED TO A DATABASE AS ADDITIVE MIGRATIONS.
+
+    Example:
+        registry = SchemaRegistry()
+        sql = SQL("db/FRMAN.sqlite", schema=registry)
+        sql.migrate()
+    """
+
+    def __init__(self, file_path=schema_yml, tables=None):
+        """
+        :param str file_path: schema YAML, see config/schema.yml; a
+            missing file gives an empty registry
+        :param dict tables: table definitions to use instead of a file
+        """
+        if tables is None:
+            tables = yml(file_path) if exists(file_path) else None
+        self.tables = {str(name).lower(): (name, definition or {})
+                       for name, definition in (tables or {}).items()}
+
+    def __contains__(self, table_name):
+        return str(table_name).lower() in self.tables
+
+    def columns(self, table_name):
+        """{COLUMN: TYPE} DECLARED FOR A TABLE."""
+        _, definition = self.tables[str(table_name).lower()]
+        return {str(column): str(column_type) for column, column_type in
+                (definition.get("columns") or {}).items()}
+
+    def primary_key(self, table_name):
+        """PRIMARY KEY COLUMNS DECLARED FOR A TABLE."""
+        _, definition = self.tables[str(table_name).lower()]
+        return [str(column) for column in
+                _as_list(definition.get("primary_key"))]
+
+    def indexes(self, table_name):
+        """
+        SECONDARY INDEXES DECLARED FOR A TABLE.
+        :return: list of (index name, columns, unique) tuples
+        """
+        _, definition = self.tables[str(table_name).lower()]
+        indexes = []
+        for index in definition.get("indexes") or []:
+            unique = False
+            if isinstance(index, dict):
+                unique = bool(index.get("unique"))
+                index = index.get("columns")
+            columns = [str(column) for column in _as_list(index)]
+            name = sub(r"\W+", "_", "ix_{}_{}".format(
+                table_name, "_".join(columns))).lower()
+            indexes.append((name, columns, unique))
+        return indexes
+
+    def create_statement(self, table_name):
+        """CREATE TABLE STATEMENT FOR A DECLARED TABLE."""
+        columns = self.columns(table_name)
+        primary_key = self.primary_key(table_name)
+        definitions = [_quote(column) + " " + column_type
+                       for column, column_type in columns.items()]
+        definitions.extend(_quote(column) + " TEXT" for column in primary_key
+                           if column not in columns)
+        if primary_key:
+            definitions.append("PRIMARY KEY (" + ", ".join(
+                _quote(column) for column in primary_key) + ")")
+        return "CREATE TABLE IF NOT EXISTS {} ({})".format(
+            _quote(table_name), ", ".join(definitions))
+
+    def apply(self, conn, table_name):
+        """
+        CREATE A DECLARED TABLE, OR ADD ITS MISSING COLUMNS, AND CREATE ITS
+        MISSING INDEXES. NOTHING IS EVER DROPPED OR RETYPED; A PRIMARY KEY
+        DECLARED AFTER THE TABLE WAS CREATED BECOMES A PLAIN INDEX.
+        :param conn: open SQLAlchemy connection
+        :param str table_name: declared table
+        :return: list of statements executed
+        """
+        info = list(conn.execute(
+            "PRAGMA table_info(" + _quote(table_name) + ")"))
+        indexes = self.indexes(table_name)
+        statements = []
+        if not info:
+            statements.append(self.create_statement(table_name))
+        else:
+            existing = {row[1] for row in info}
+            for column, column_type in self.columns(table_name).items():
+                if column not in existing:
+                    statements.append(
+                        "ALTER TABLE " + _quote(table_name) +
+                        " ADD COLUMN " + _quote(column) + " " + column_type)
+            primary_key = self.primary_key(table_name)
+            current_key = [row[1] for row in
+                           sorted(info, key=lambda row: row[5]) if row[5]]
+            if primary_key and primary_key != current_key:
+                indexes = [(sub(r"\W+", "_", "pk_{}".format(
+                    table_name)).lower(), primary_key, False)] + indexes
+            if statements:
+                log.info("Migrating %s: %s", table_name,
+                         "; ".join(statements))
+        for name, columns, unique in indexes:
+            statements.append(
+                "CREATE {}INDEX IF NOT EXISTS {} ON {} ({})".format(
+                    "UNIQUE " if unique else "", _quote(name),
+                    _quote(table_name),
+                    ", ".join(_quote(column) for column in columns)))
+        for statement in statements:
+            conn.execute(statement)
+        return statements
@@ -4,29 +4,58 @@
 
 """GOOGLE SHEETS OPERATIONS FOR READING/WRITING DATA."""
 
+from atexit import register, unregister
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from json import dumps, loads
 from os.path import exists
 from pickle import dump as pkdump
 from pickle import load as pkload
+from threading import Condition, Event, Thread, local
+from time import monotonic, sleep
 
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from pandas import DataFrame, to_datetime, to_timedelta
-from pygsheets import authorize
 from logging import getLogger
 from FRMAN.Utils import LOG_LEVEL
-from FRMAN.Utils import yml
-yaml = yml()
+from FRMAN.Metrics import incr, timed
+from FRMAN.Utils import lazy_import, yml
+
+pandas = lazy_import("pandas")
 
 getLogger('googleapiclient.discovery').setLevel(LOG_LEVEL.ERROR)
+log = getLogger(__name__)
+
+
+def _column_letter(index):
+    """1-BASED COLUMN NUMBER TO A1 LETTERS."""
+    letters = ""
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _as_text(dataframe):
+    """DATAFRAME AS STRINGS WITH BLANKS FOR NULLS, AS A SHEET HOLDS IT."""
+    return dataframe.astype(object).where(dataframe.notna(), "") \
+        .astype(str).reset_index(drop=True)
 
 
 class Sheets:
     """MAIN CLASS TO INTERACT WITH GOOGLE SHEETS DATA."""
 
-    def __init__(self, token, client_secret):
-        """GOOGLE API AUTORIZATION."""
+    def __init__(self, token, client_secret, handle_ttl=300,
+                 transport=None):
+        """GOOGLE API AUTORIZATION.
+
+        THE PYGSHEETS CLIENT, SPREADSHEETS AND WORKSHEETS ARE CACHED FOR
+        `handle_ttl` SECONDS, SEE `refresh`. `transport` IS A CALLABLE
+        RETURNING A NEW httplib2.Http FOR EVERY CONNECTION (E.G. FOR A PROXY
+        OR THE LOCAL FAKE SERVER IN benchmarks/), DEFAULTING TO httplib2.Http.
+        """
+        from google.auth.transport.requests import Request
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from googleapiclient.discovery import build
         creds = None
         if exists(token):
             with open(token, "rb") as gtoken:
@@ -36,15 +65,70 @@ class Sheets:
                 creds.refresh(Request())
             else:
                 flow = InstalledAppFlow.from_client_secrets_file(
-                    client_secret, yaml["google_sheets"]["scope"])
+                    client_secret, yml()["google_sheets"]["scope"])
                 creds = flow.run_local_server()
             with open(token, "wb") as gtoken:
                 pkdump(creds, gtoken)
         self.credentials = creds
-        service = build("sheets", "v4", credentials=creds,
-                        cache_discovery=False)
+        self.transport = transport
+        if transport is None:
+            service = build("sheets", "v4", credentials=creds,
+                            cache_discovery=False)
+        else:
+            from google_auth_httplib2 import AuthorizedHttp
+            service = build("sheets", "v4", cache_discovery=False,
+                            http=AuthorizedHttp(creds, http=transport()))
         self.service = service
+        self.handle_ttl = handle_ttl
+        self._handles = dict()
+        self._snapshots = dict()
+        self._local = local()
 
+    def _handle(self, key, factory):
+        """RETURN A CACHED HANDLE, REBUILDING IT ONCE ITS TTL EXPIRES."""
+        cached = self._handles.get(key)
+        if cached is not None and cached[0] > monotonic():
+            return cached[1]
+        handle = factory()
+        self._handles[key] = (monotonic() + self.handle_ttl, handle)
+        return handle
+
+    def client(self):
+        """AUTHORIZED PYGSHEETS CLIENT."""
+        from pygsheets import authorize
+        if self.transport is None:
+            return self._handle(("client",), lambda: authorize(
+                custom_credentials=self.credentials))
+        return self._handle(("client",), lambda: authorize(
+            custom_credentials=self.credentials, http=self.transport()))
+
+    def spreadsheet(self, sheet_id):
+        """PYGSHEETS SPREADSHEET BY KEY."""
+        return self._handle(("spreadsheet", sheet_id),
+                            lambda: self.client().open_by_key(sheet_id))
+
+    def worksheet(self, sheet_id, sheet_name=None):
+        """PYGSHEETS WORKSHEET BY TITLE, OR THE FIRST WORKSHEET."""
+        def factory():
+            spreadsheet = self.spreadsheet(sheet_id)
+            if sheet_name is None:
+                return spreadsheet[0]
+            return spreadsheet.worksheet_by_title(sheet_name)
+        return self._handle(("worksheet", sheet_id, sheet_name), factory)
+
+    def refresh(self, sheet_id=None):
+        """
+        DROP CACHED HANDLES, FOR ONE SPREADSHEET OR (BY DEFAULT) ALL, E.G.
+        AFTER WORKSHEETS ARE ADDED, RENAMED OR RESIZED ELSEWHERE.
+        """
+        if sheet_id is None:
+            self._handles.clear()
+            return
+        for key in [key for key in self._handles
+                    if len(key) > 1 and key[1] == sheet_id]:
+            del self._handles[key]
+
+    @timed("sheets.get_sheet")
     def get_sheet(self, sheet_id, sheet_range):
         """GET SHEET RAW DATA."""
         sheet = self.service.spreadsheets(). \
@@ -53,26 +137,130 @@ class Sheets:
                          valueRenderOption="UNFORMATTED_VALUE",
                          dateTimeRenderOption="FORMATTED_STRING").execute()
         values = sheet["values"]
+        incr("sheets.requests")
+        incr("sheets.rows_read", len(values))
         return values
 
+    @timed("sheets.get_sheets")
+    def get_sheets(self, ranges, max_workers=4, dtype=None, schema=None):
+        """
+        GET MANY RANGES AS DATAFRAMES.
+
+        RANGES ARE GROUPED INTO ONE values.batchGet PER SPREADSHEET AND
+        THE SPREADSHEETS ARE FETCHED CONCURRENTLY ON A BOUNDED THREAD POOL,
+        SHARING THIS INSTANCE'S DISCOVERY SERVICE.
+
+        Example:
+            frames = sheets.get_sheets([(sheet_id, "Requests!A:Z"),
+                                        (sheet_id, "Solicitudes!A:Z")])
+            requests_df = frames[(sheet_id, "Requests!A:Z")]
+        :param list ranges: (sheet_id, sheet_range) pairs
+        :param int max_workers: spreadsheets fetched at once
+        :param dtype: passed to `prepare_sheet`
+        :param dict schema: passed to `prepare_sheet`
+        :return: dict of {(sheet_id, sheet_range): DataFrame}
+        """
+        grouped = OrderedDict()
+        for sheet_id, sheet_range in ranges:
+            grouped.setdefault(sheet_id, []).append(sheet_range)
+
+        def fetch(sheet_id):
+            sheet_ranges = grouped[sheet_id]
+            response = self.service.spreadsheets().values().batchGet(
+                spreadsheetId=sheet_id, ranges=sheet_ranges,
+                valueRenderOption="UNFORMATTED_VALUE",
+                dateTimeRenderOption="FORMATTED_STRING"
+            ).execute(http=self._http())
+            incr("sheets.requests")
+            return {(sheet_id, sheet_range): self.prepare_sheet(
+                value_range.get("values") or [[]], dtype=dtype,
+                schema=schema)
+                for sheet_range, value_range in zip(
+                    sheet_ranges, response.get("valueRanges", []))}
+
+        dataframes = dict()
+        if len(grouped) == 1:
+            dataframes.update(fetch(next(iter(grouped))))
+            return dataframes
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for result in pool.map(fetch, grouped):
+                dataframes.update(result)
+        return dataframes
+
+    def _http(self):
+        """
+        AUTHORIZED HTTP FOR THE CURRENT THREAD. httplib2 IS NOT
+        THREAD-SAFE, SO EACH WORKER SENDS REQUESTS ON ITS OWN.
+        """
+        http = getattr(self._local, "http", None)
+        if http is None:
+            from google_auth_httplib2 import AuthorizedHttp
+            from httplib2 import Http
+            http = AuthorizedHttp(self.credentials,
+                                  http=(self.transport or Http)())
+            self._local.http = http
+        return http
+
+    @staticmethod
+    @timed("sheets.prepare_sheet")
+    def prepare_sheet(sheet, dtype=None, schema=None):
+        """FORMAT DATA INTO A DATAFRAME.
+
+        THE FIRST ROW IS THE HEADER. ROWS ARE PADDED (OR TRIMMED) TO ITS
+        WIDTH, SINCE THE API DROPS TRAILING EMPTY CELLS. SEE `apply_schema`
+        FOR `schema`.
+        """
+        if not sheet:
+            return pandas.DataFrame()
+        header = sheet[0]
+        width = len(header)
+        rows = [row if len(row) == width else
+                row[:width] + [None] * (width - len(row))
+                for row in sheet[1:]]
+        dataframe = pandas.DataFrame(rows, columns=header, dtype=dtype)
+        if schema:
+            dataframe = Sheets.apply_schema(dataframe, schema)
+        return dataframe
+
     @staticmethod
-    def prepare_sheet(sheet, dtype=None):
-        """FORMAT DATA INTO A DATAFRAME."""
-        dataframe = DataFrame(sheet, columns=sheet[0], dtype=dtype)
-        del sheet
-        dataframe.drop(0, axis=0, inplace=True)
-        dataframe.reset_index(drop=True, inplace=True)
+    def apply_schema(dataframe, schema):
+        """
+        CAST COLUMNS BY A {COLUMN: TYPE} SCHEMA. TYPES ARE "int" (NULLABLE),
+        "float", "category", "date" (EXCEL SERIAL NUMBERS) OR ANY DTYPE.
+        BLANK OR UNPARSEABLE CELLS BECOME NULLS.
+        """
+        for column, column_type in schema.items():
+            if column not in dataframe:
+                continue
+            series = dataframe[column]
+            if column_type == "int":
+                series = pandas.to_numeric(series, errors="coerce") \
+                    .round().astype("Int64")
+            elif column_type == "float":
+                series = pandas.to_numeric(series, errors="coerce") \
+                    .astype("float64")
+            elif column_type == "date":
+                series = Sheets.convert_excel_time(series)
+            else:
+                series = series.astype(column_type)
+            dataframe[column] = series
         return dataframe
 
+    @timed("sheets.sheet_to_df")
     def sheet_to_df(self, sheet_id, sheet_name=None, sheet_range=None,
-                    value_render="UNFORMATTED_VALUE"):
-        """CONVERT GOOGLE SHEET TO DATAFRAME."""
-        pyg = authorize(custom_credentials=self.credentials)
-        spreadsheet = pyg.open_by_key(sheet_id)
-        if sheet_name is None:
-            wks = spreadsheet[0]
-        else:
-            wks = spreadsheet.worksheet_by_title(sheet_name)
+                    value_render="UNFORMATTED_VALUE", cache=None):
+        """
+        CONVERT GOOGLE SHEET TO DATAFRAME.
+        :param SnapshotCache cache: serve fresh snapshots from, and store
+            new pulls in, this local cache
+        """
+        if cache is not None:
+            return cache.fetch(
+                "sheets:" + sheet_id, lambda: self.sheet_to_df(
+                    sheet_id, sheet_name, sheet_range, value_render),
+                sheet_name=sheet_name, sheet_range=sheet_range,
+                value_render=value_render)
+        wks = self.worksheet(sheet_id, sheet_name)
         if sheet_range is not None:
             start = sheet_range.split(":")[0]
             end = sheet_range.split(":")[1]
@@ -81,38 +269,367 @@ class Sheets:
             end = None
         dataframe = wks.get_as_df(
             start=start, end=end, value_render=value_render)
+        incr("sheets.rows_read", len(dataframe))
         return dataframe
 
+    @timed("sheets.backup_to_sheet")
     def backup_to_sheet(self, sheet_id, dataframe, sheet_name=None,
-                        set_range=(2, 1)):
-        """APPEND DATAFRAME INTO GOOGLE SHEET."""
-        pyg = authorize(custom_credentials=self.credentials)
-        spreadsheet = pyg.open_by_key(sheet_id)
-        if sheet_name is None:
-            wks = spreadsheet[0]
-        else:
-            wks = spreadsheet.worksheet_by_title(sheet_name)
-        wks.clear(start="A1", end="ZZ10000")
+                        set_range=(2, 1), key=None, max_changes=0.5):
+        """APPEND DATAFRAME INTO GOOGLE SHEET.
+
+        WITH A `key` COLUMN, ONLY ROWS THAT WERE CHANGED, ADDED OR REMOVED
+        SINCE THE LAST BACKUP (CACHED, OR READ BACK FROM THE SHEET) ARE
+        SENT, IN ONE values.batchUpdate. THE SHEET IS FULLY REWRITTEN WHEN
+        MORE THAN `max_changes` OF THE ROWS WOULD BE WRITTEN.
+        """
+        wks = self.worksheet(sheet_id, sheet_name)
         dataframe["Date"] = dataframe["Date"].apply(
             lambda x: x.strftime("%m/%d/%Y"))
         dataframe["Timestamp"] = datetime.now()
+        if key is not None and self._backup_diff(
+                sheet_id, wks, dataframe, set_range, key, max_changes):
+            return dataframe
+        wks.clear()
         wks.set_dataframe(dataframe, set_range,
                           copy_index=False, copy_head=True, nan="")
+        incr("sheets.rows_written", len(dataframe))
+        self._snapshots[(sheet_id, wks.title)] = _as_text(dataframe)
         return dataframe
 
+    def _backup_diff(self, sheet_id, wks, dataframe, set_range, key,
+                     max_changes):
+        """
+        WRITE THE DIFFERENCE AGAINST THE LAST SNAPSHOT. REMOVED ROWS ARE
+        REFILLED WITH ADDED ROWS OR ROWS MOVED UP FROM THE END, SO NO ROWS
+        HAVE TO BE DELETED. RETURN FALSE WHEN A FULL REWRITE IS NEEDED.
+        """
+        snapshot = self._snapshots.get((sheet_id, wks.title))
+        if snapshot is None:
+            snapshot = self._read_snapshot(sheet_id, wks, set_range,
+                                           len(dataframe.columns))
+        new = _as_text(dataframe)
+        if snapshot is None or list(snapshot.columns) != list(new.columns) \
+                or key not in new or new[key].duplicated().any() \
+                or snapshot[key].duplicated().any():
+            return False
+        old_rows = snapshot.set_index(key, drop=False)
+        new_rows = new.set_index(key, drop=False)
+        compare = [column for column in new.columns if column != "Timestamp"]
+        common = old_rows.index.intersection(new_rows.index)
+        differs = (old_rows.loc[common, compare] !=
+                   new_rows.loc[common, compare]).any(axis=1)
+        changed = set(common[differs.values])
+        old_keys = snapshot[key].tolist()
+        layout = [row_key if row_key in new_rows.index else None
+                  for row_key in old_keys]
+        added = iter([row_key for row_key in new[key]
+                      if row_key not in old_rows.index])
+        for position, row_key in enumerate(layout):
+            if row_key is None:
+                layout[position] = next(added, None)
+        layout.extend(added)
+        while None in layout:
+            if layout[-1] is None:
+                layout.pop()
+            else:
+                layout[layout.index(None)] = layout.pop()
+        writes = [position for position, row_key in enumerate(layout)
+                  if position >= len(old_keys) or
+                  old_keys[position] != row_key or row_key in changed]
+        clears = list(range(len(layout), len(old_keys)))
+        if len(writes) + len(clears) > max_changes * max(len(new), 1):
+            return False
+        header_row, first_column = set_range
+        last_column = _column_letter(first_column + len(new.columns) - 1)
+        data = []
+        for positions, blank in ((writes, False), (clears, True)):
+            runs = []
+            for position in positions:
+                if runs and runs[-1][-1] == position - 1:
+                    runs[-1].append(position)
+                else:
+                    runs.append([position])
+            for run in runs:
+                if blank:
+                    values = [[""] * len(new.columns)] * len(run)
+                else:
+                    values = new_rows.loc[[layout[position]
+                                           for position in run]] \
+                        .values.tolist()
+                data.append({"range": "'{}'!{}{}:{}{}".format(
+                    wks.title, _column_letter(first_column),
+                    header_row + 1 + run[0], last_column,
+                    header_row + 1 + run[-1]), "values": values})
+        if data:
+            needed = header_row + max(len(layout), len(old_keys))
+            if needed > wks.rows:
+                wks.add_rows(needed - wks.rows)
+            self.service.spreadsheets().values().batchUpdate(
+                spreadsheetId=sheet_id,
+                body={"valueInputOption": "USER_ENTERED",
+                      "data": data}).execute()
+            incr("sheets.requests")
+            incr("sheets.rows_written", len(writes) + len(clears))
+        written = {layout[position] for position in writes}
+        final = new_rows.loc[layout].reset_index(drop=True)
+        kept = [row_key not in written for row_key in layout]
+        if any(kept):
+            final.loc[kept, "Timestamp"] = old_rows.loc[
+                [row_key for row_key in layout if row_key not in written],
+                "Timestamp"].values
+        self._snapshots[(sheet_id, wks.title)] = final
+        return True
+
+    def _read_snapshot(self, sheet_id, wks, set_range, width):
+        """READ A PREVIOUS BACKUP BACK FROM THE SHEET AS TEXT."""
+        header_row, first_column = set_range
+        sheet_range = "'{}'!{}{}:{}".format(
+            wks.title, _column_letter(first_column), header_row,
+            _column_letter(first_column + width - 1))
+        values = self.service.spreadsheets().values().get(
+            spreadsheetId=sheet_id, range=sheet_range,
+            valueRenderOption="FORMATTED_VALUE").execute().get("values")
+        if not values:
+            return None
+        header = values[0]
+        rows = [row[:len(header)] + [""] * (len(header) - len(row))
+                for row in values[1:]]
+        return pandas.DataFrame(rows, columns=header, dtype=str)
+
+    @timed("sheets.append")
     def append(self, values, sheet_id, start='A1', end=None,
                dimension='ROWS', overwrite=False, sheet_name=None):
         """APPEND VLAUE TO SHEET."""
-        pyg = authorize(custom_credentials=self.credentials)
-        spreadsheet = pyg.open_by_key(sheet_id)
-        if sheet_name is None:
-            wks = spreadsheet[0]
-        else:
-            wks = spreadsheet.worksheet_by_title(sheet_name)
+        wks = self.worksheet(sheet_id, sheet_name)
         wks.append_table(values=values, start=start, end=end,
                          dimension=dimension, overwrite=overwrite)
+        incr("sheets.requests")
+        incr("sheets.rows_written", len(values))
+
+    def appender(self, sheet_id, sheet_name=None, **kwargs):
+        """
+        RETURN A BUFFERED `SheetAppender` FOR ROW-AT-A-TIME APPENDS.
+
+        Example:
+            with sheets.appender(sheet_id, "Log", spool="db/log.spool") as log:
+                log.append(["2020-04-01", "request received"])
+        """
+        return SheetAppender(self, sheet_id, sheet_name, **kwargs)
 
     @staticmethod
     def convert_excel_time(excel_time):
-        """UNSERIALIZE EXCEL DATETIME."""
-        return to_datetime("1899-12-30") + to_timedelta(excel_time, "D")
+        """UNSERIALIZE EXCEL DATETIME. TAKES A NUMBER OR A WHOLE SERIES."""
+        return pandas.to_datetime(
+            pandas.to_numeric(excel_time, errors="coerce"),
+            unit="D", origin="1899-12-30")
+
+
+class SheetAppender:
+    """
+    WRITE-BEHIND BUFFER FOR APPENDS TO ONE WORKSHEET.
+
+    ROWS ARE COLLECTED IN MEMORY AND SENT AS ONE APPEND BY A BACKGROUND
+    THREAD, ON A PYGSHEETS CLIENT AND HTTP CONNECTION OF ITS OWN (httplib2
+    IS NOT THREAD-SAFE), WHEN `max_rows` ARE WAITING, EVERY `interval` SECONDS, OR ON
+    `flush`/`close`. FAILED SENDS ARE RETRIED WITH EXPONENTIAL BACKOFF AND
+    KEPT, IN ORDER, FOR THE NEXT FLUSH. THE BUFFER IS FLUSHED AT INTERPRETER
+    EXIT; WITH A `spool` FILE EVERY BUFFERED ROW IS ALSO JOURNALED TO DISK
+    AND ROWS LEFT BY A CRASH ARE RECOVERED AND SENT BY THE NEXT APPENDER ON
+    THAT SPOOL. ROWS THAT STILL CANNOT BE SENT AT CLOSE ARE LOGGED AND KEPT
+    IN `unsent` (AND IN THE SPOOL).
+    """
+
+    def __init__(self, sheets, sheet_id, sheet_name=None, max_rows=500,
+                 interval=10.0, retries=5, backoff=1.0, spool=None):
+        """
+        :param Sheets sheets: source of the credentials and transport
+        :param str sheet_id: spreadsheet id
+        :param str sheet_name: worksheet title, default the first sheet
+        :param int max_rows: rows that trigger a flush
+        :param float interval: seconds between timed flushes
+        :param int retries: retries per flush before the rows are kept
+        :param float backoff: first retry delay in seconds, doubling
+        :param str spool: JSON-lines journal of unsent rows
+        """
+        self.sheets = sheets
+        self.sheet_id = sheet_id
+        self.sheet_name = sheet_name
+        self.max_rows = max_rows
+        self.interval = interval
+        self.retries = retries
+        self.backoff = backoff
+        self.spool = spool
+        self.unsent = []
+        self._worksheet_handle = None
+        self._buffer = []
+        self._queued = 0
+        self._sent = 0
+        self._failures = 0
+        self._condition = Condition()
+        self._wake = Event()
+        self._closed = False
+        self._journal = None
+        if spool is not None:
+            recovered = self._recover(spool)
+            if recovered:
+                log.warning("Recovered %s unsent rows from %s",
+                            len(recovered), spool)
+                self._buffer.extend(recovered)
+                self._queued += len(recovered)
+            self._journal = open(spool, "w")
+            self._rewrite_journal()
+        self._thread = Thread(target=self._run, daemon=True,
+                              name="SheetAppender-" + str(sheet_id))
+        self._thread.start()
+        register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, row):
+        """BUFFER ONE ROW (A LIST OF CELL VALUES)."""
+        self.extend([row])
+
+    def extend(self, rows):
+        """BUFFER SEVERAL ROWS."""
+        rows = [list(row) for row in rows]
+        with self._condition:
+            if self._closed:
+                raise ValueError("SheetAppender is closed")
+            self._buffer.extend(rows)
+            self._queued += len(rows)
+            if self._journal is not None:
+                self._journal.write("".join(
+                    dumps(row, default=str) + "\n" for row in rows))
+                self._journal.flush()
+            if len(self._buffer) >= self.max_rows:
+                self._wake.set()
+
+    def flush(self, timeout=None):
+        """
+        SEND EVERYTHING BUFFERED SO FAR AND WAIT UNTIL IT IS SENT OR A SEND
+        FAILS (AFTER ITS RETRIES).
+        :return: True if every row buffered before the call was sent
+        """
+        with self._condition:
+            target = self._queued
+            failures = self._failures
+            self._wake.set()
+            self._condition.wait_for(
+                lambda: self._sent >= target or
+                self._failures > failures or
+                not self._thread.is_alive(), timeout)
+            return self._sent >= target
+
+    def close(self):
+        """
+        FLUSH, STOP THE BACKGROUND THREAD AND REPORT ANY UNSENT ROWS.
+        :return: list of rows that could not be sent
+        """
+        with self._condition:
+            if self._closed:
+                return self.unsent
+            self._closed = True
+        unregister(self.close)
+        self._wake.set()
+        self._thread.join()
+        if self._journal is not None:
+            self._journal.close()
+        if self.unsent:
+            log.error("%s rows could not be appended to %s%s",
+                      len(self.unsent), self.sheet_id,
+                      ", kept in " + self.spool if self.spool else "")
+        return self.unsent
+
+    def _run(self):
+        """BACKGROUND LOOP: SEND ON SIZE, INTERVAL, FLUSH AND CLOSE."""
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            closing = self._closed
+            self._send(final=closing)
+            if closing:
+                return
+
+    def _send(self, final=False):
+        """SEND THE BUFFER AS ONE APPEND, RETRYING; KEEP IT ON FAILURE."""
+        with self._condition:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        for attempt in range(self.retries + 1):
+            try:
+                self._worksheet().append_table(
+                    values=batch, start="A1", dimension="ROWS",
+                    overwrite=False)
+                incr("sheets.requests")
+                incr("sheets.rows_written", len(batch))
+                break
+            except Exception as error:
+                self._worksheet_handle = None
+                log.warning("Append of %s rows failed (attempt %s): %s",
+                            len(batch), attempt + 1, error)
+                if attempt < self.retries:
+                    sleep(self.backoff * 2 ** attempt)
+        else:
+            with self._condition:
+                self._buffer[:0] = batch
+                if final:
+                    self.unsent = list(self._buffer)
+                self._failures += 1
+                self._condition.notify_all()
+            return
+        incr("sheets.appender_flushes")
+        with self._condition:
+            self._sent += len(batch)
+            if self._journal is not None:
+                self._rewrite_journal()
+            self._condition.notify_all()
+
+    def _worksheet(self):
+        """
+        WORKSHEET HANDLE ON A CLIENT BUILT FOR THE FLUSH THREAD ALONE;
+        REBUILT AFTER A FAILED SEND.
+        """
+        if self._worksheet_handle is None:
+            from pygsheets import authorize
+            transport = self.sheets.transport
+            client = authorize(
+                custom_credentials=self.sheets.credentials,
+                http=transport() if transport is not None else None)
+            spreadsheet = client.open_by_key(self.sheet_id)
+            self._worksheet_handle = spreadsheet[0] \
+                if self.sheet_name is None else \
+                spreadsheet.worksheet_by_title(self.sheet_name)
+        return self._worksheet_handle
+
+    @staticmethod
+    def _recover(spool):
+        """
+        READ THE ROWS LEFT IN A SPOOL. A LINE CUT SHORT BY A CRASH MID-WRITE
+        IS LOGGED AND SKIPPED.
+        """
+        if not exists(spool):
+            return []
+        rows = []
+        with open(spool) as spool_file:
+            for number, line in enumerate(spool_file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(loads(line))
+                except ValueError:
+                    log.error("Skipping malformed line %s of %s: %r",
+                              number, spool, line[:200])
+        return rows
+
+    def _rewrite_journal(self):
+        """REPLACE THE SPOOL CONTENTS WITH THE ROWS STILL BUFFERED."""
+        self._journal.seek(0)
+        self._journal.truncate()
+        self._journal.write("".join(
+            dumps(row, default=str) + "\n" for row in self._buffer))
+        self._journal.flush()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""
+LOCAL COLUMNAR SNAPSHOTS OF AIRTABLE AND GOOGLE SHEETS PULLS.
+
+EACH SNAPSHOT IS AN UNCOMPRESSED FEATHER (ARROW IPC) FILE, READ BACK
+MEMORY-MAPPED, PLUS A JSON SIDECAR HOLDING ITS SOURCE, PARAMETERS, CREATION
+TIME AND A SHA-256 CONTENT HASH. SNAPSHOTS OLDER THAN THEIR TTL ARE REFETCHED.
+
+Example:
+    snapshots = SnapshotCache()
+    requests_df = airtable.get_airtable_raw(cache=snapshots)
+    sheets_df = sheets.sheet_to_df(sheet_id, "Requests", cache=snapshots)
+"""
+
+from hashlib import sha256
+from json import dumps, load, loads
+from os import listdir, makedirs, remove, replace
+from os.path import exists, join
+from time import time
+
+from FRMAN.Metrics import incr
+from FRMAN.Utils import yml
+
+
+def _json_default(value):
+    """ENCODE TIMESTAMPS, NUMPY SCALARS AND THE LIKE INSIDE JSON COLUMNS."""
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class SnapshotCache:
+    """FEATHER SNAPSHOT STORE KEYED BY SOURCE AND PULL PARAMETERS."""
+
+    def __init__(self, directory=None, ttl=None):
+        """
+        :param str directory: where snapshots live, defaults to
+            `snapshots.directory` in config/config.yml
+        :param float ttl: seconds a snapshot stays fresh, defaults to
+            `snapshots.ttl` in config/config.yml; None never expires
+        """
+        config = yml().get("snapshots") or {}
+        self.directory = directory or config.get("directory",
+                                                 "db/snapshots")
+        self.ttl = ttl if ttl is not None else config.get("ttl")
+        makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(source, **params):
+        """STABLE FILE KEY FOR A SOURCE AND ITS RANGE/FILTER PARAMETERS."""
+        return sha256(dumps([source, params], sort_keys=True,
+                            default=str).encode()).hexdigest()[:32]
+
+    def _paths(self, key):
+        base = join(self.directory, key)
+        return base + ".feather", base + ".json"
+
+    def info(self, source, **params):
+        """RETURN THE SIDECAR METADATA OF A SNAPSHOT, OR NONE."""
+        return self._read_meta(self.key(source, **params))
+
+    def get(self, source, ttl=None, **params):
+        """
+        LOAD A SNAPSHOT, OR NONE WHEN IT IS MISSING OR OLDER THAN `ttl`
+        (DEFAULTS TO THE CACHE TTL).
+        """
+        from pyarrow import feather
+        meta = self.info(source, **params)
+        ttl = self.ttl if ttl is None else ttl
+        if meta is None or (ttl is not None and
+                            time() - meta["created"] > ttl):
+            incr("snapshots.misses")
+            return None
+        data_path, _ = self._paths(self.key(source, **params))
+        dataframe = feather.read_table(
+            data_path, memory_map=True).to_pandas()
+        for position in meta["json_columns"]:
+            column = dataframe.columns[position]
+            dataframe[column] = [None if value is None else loads(value)
+                                 for value in dataframe[column]]
+        dataframe.columns = meta["columns"]
+        incr("snapshots.hits")
+        return dataframe
+
+    def put(self, dataframe, source, **params):
+        """
+        STORE A SNAPSHOT, WRITTEN ATOMICALLY. LIST/DICT COLUMNS (AIRTABLE
+        MULTI-SELECTS, ATTACHMENTS) AND MIXED COLUMNS ARROW CANNOT TYPE ARE
+        STORED AS JSON TEXT AND DECODED ON LOAD. REPEATED COLUMN NAMES (E.G.
+        BLANK SHEET HEADERS) ARE MADE UNIQUE ON DISK AND RESTORED ON LOAD.
+        :return: the sidecar metadata, including "content_hash"
+        """
+        import pyarrow
+        from pyarrow import feather
+        key = self.key(source, **params)
+        data_path, meta_path = self._paths(key)
+        columns = list(dataframe.columns)
+        dataframe = dataframe.reset_index(drop=True)
+        names = [str(column) for column in columns]
+        dataframe.columns = [
+            name if names.count(name) == 1 else
+            "{}.{}".format(name, position)
+            for position, name in enumerate(names)]
+        json_columns = []
+        for position, column in enumerate(dataframe.columns):
+            values = dataframe[column]
+            if values.dtype != object:
+                continue
+            if any(isinstance(value, (list, dict, tuple))
+                   for value in values):
+                json_columns.append(position)
+                continue
+            try:
+                pyarrow.array(values, from_pandas=True)
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError,
+                    pyarrow.ArrowNotImplementedError):
+                json_columns.append(position)
+        if json_columns:
+            dataframe = dataframe.copy()
+            for position in json_columns:
+                column = dataframe.columns[position]
+                dataframe[column] = [
+                    None if value is None else dumps(
+                        value, sort_keys=True, default=_json_default)
+                    for value in dataframe[column]]
+        feather.write_feather(dataframe, data_path + ".tmp",
+                              compression="uncompressed")
+        digest = sha256()
+        with open(data_path + ".tmp", "rb") as data_file:
+            for block in iter(lambda: data_file.read(1 << 20), b""):
+                digest.update(block)
+        meta = {"source": source, "params": params, "created": time(),
+                "rows": len(dataframe), "columns": columns,
+                "json_columns": json_columns,
+                "content_hash": digest.hexdigest()}
+        with open(meta_path + ".tmp", "w") as meta_file:
+            meta_file.write(dumps(meta, sort_keys=True, default=str))
+        replace(data_path + ".tmp", data_path)
+        replace(meta_path + ".tmp", meta_path)
+        return meta
+
+    def fetch(self, source, loader, ttl=None, refresh=False, **params):
+        """
+        RETURN A FRESH SNAPSHOT, OR CALL `loader()` AND STORE ITS RESULT.
+
+        Example:
+            dataframe = snapshots.fetch(
+                "sheets:" + sheet_id, lambda: pull(sheet_id), sheet="Log")
+        :param str source: source name, e.g. "airtable:<base>/<table>"
+        :param callable loader: returns the DataFrame on a miss
+        :param float ttl: freshness override for this call
+        :param bool refresh: ignore any stored snapshot
+        :param params: range/filter parameters that key the snapshot
+        """
+        if not refresh:
+            dataframe = self.get(source, ttl=ttl, **params)
+            if dataframe is not None:
+                return dataframe
+        dataframe = loader()
+        self.put(dataframe, source, **params)
+        return dataframe
+
+    def invalidate(self, source=None, **params):
+        """
+        DELETE ONE SNAPSHOT, EVERY SNAPSHOT OF `source` (WITHOUT `params`),
+        OR EVERY SNAPSHOT (WITHOUT EITHER).
+        """
+        if params:
+            keys = [self.key(source, **params)]
+        else:
+            keys = [name[:-len(".json")] for name in listdir(self.directory)
+                    if name.endswith(".json")]
+            if source is not None:
+                keys = [key for key in keys
+                        if (self._read_meta(key) or {}).get("source") ==
+                        source]
+        for key in keys:
+            for path in self._paths(key):
+                if exists(path):
+                    remove(path)
+
+    def _read_meta(self, key):
+        _, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as meta_file:
+                return load(meta_file)
+        except (OSError, ValueError):
+            return None
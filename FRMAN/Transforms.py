@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+REQUEST CLEANING STAGES DRIVEN BY THE MIGRATION YAML.
+"""
+
+from FRMAN.Utils import lazy_import
+
+numpy = lazy_import("numpy")
+pandas = lazy_import("pandas")
+
+
+def merge_languages(dataframe, sheet_yaml, mapping_key="spanish_to_english",
+                    selector_key="language_selector"):
+    """
+    COALESCE THE SPANISH AND ENGLISH ANSWER COLUMNS INTO ONE ENGLISH SET.
+
+    EACH ROW TAKES ITS VALUES FROM THE LANGUAGE PICKED IN THE SELECTOR
+    COLUMN, WHICH IS REPLACED BY A "language" TAG. ROWS WITH NO RECOGNISED
+    LANGUAGE ARE DROPPED. THE RESULT IS BUILT COLUMN BY COLUMN IN ONE PASS,
+    SO ONLY THE OUTPUT FRAME IS ALLOCATED.
+
+    Example:
+        sheet_yaml = yml("migration/sheets.yaml")
+        requests = merge_languages(request_df, sheet_yaml)
+    :param DataFrame dataframe: raw form responses
+    :param dict sheet_yaml: parsed migration/sheets.yaml
+    :param str mapping_key: YAML key of the {spanish: english} column map
+    :param str selector_key: YAML key of the language selector definition
+    :return: DataFrame with English column names and a "language" column
+    """
+    mapping = sheet_yaml[mapping_key]
+    selector = sheet_yaml[selector_key]
+    language = dataframe[selector["column"]].map(selector["values"])
+    keep = language.notna().values
+    is_spanish = (language == "spanish").values[keep]
+    spanish = {english: spanish for spanish, english in mapping.items()}
+    columns = dict()
+    for column in dataframe.columns:
+        if column in mapping or column == selector["column"]:
+            continue
+        values = dataframe[column].values[keep]
+        if column in spanish and spanish[column] in dataframe:
+            values = numpy.where(is_spanish,
+                                 dataframe[spanish[column]].values[keep],
+                                 values)
+        columns[column] = values
+    columns["language"] = language.values[keep]
+    return pandas.DataFrame(columns, index=dataframe.index[keep])
+
+
+def parse_needs(dataframe, sheet_yaml, column="What do you need?"):
+    """
+    ADD "needs_list" AND "additional_info" COLUMNS PARSED FROM THE NEEDS
+    ANSWER COLUMN (SEE `NeedsMatcher`).
+    """
+    from FRMAN.Needs import NeedsMatcher
+    parsed = NeedsMatcher.from_yaml(sheet_yaml).parse(dataframe[column])
+    return dataframe.assign(needs_list=parsed["needs_list"],
+                            additional_info=parsed["additional_info"])
+
+
+def join_columns(dataframe, columns, target, separator="\n"):
+    """
+    ADD `target`: THE TEXT OF `columns` JOINED WITH `separator` AND
+    STRIPPED, COLUMN-WISE RATHER THAN ROW BY ROW.
+    """
+    text = dataframe[columns].astype(str)
+    joined = text[columns[0]]
+    for column in columns[1:]:
+        joined = joined + separator + text[column]
+    return dataframe.assign(**{target: joined.str.strip()})
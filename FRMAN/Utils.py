@@ -4,18 +4,52 @@ adjuftments Utilities File. So far, just yml and logging.
 """
 
 from argparse import ArgumentParser
+from functools import lru_cache
+from importlib import import_module
+from importlib.util import find_spec
 from logging import FileHandler, StreamHandler, basicConfig, getLevelName
-from os import environ
+from os import environ, stat
 from os.path import abspath, join
 from pathlib import Path
 from re import compile
-from tabulate import tabulate
+from sys import modules
+from threading import Event, Lock, Thread
+from types import ModuleType
 
 from yaml import SafeLoader, load
 
 
+class _LazyModule(ModuleType):
+    """MODULE PLACEHOLDER THAT IMPORTS THE REAL MODULE ON FIRST USE."""
+
+    _lock = Lock()
+
+    def __getattr__(self, attribute):
+        with self._lock:
+            module = self.__dict__.get("_module")
+            if module is None:
+                module = import_module(self.__name__)
+                self.__dict__.update(module.__dict__)
+                self.__dict__["_module"] = module
+        return getattr(module, attribute)
+
+
+def lazy_import(name):
+    """
+    RETURN A MODULE THAT IS ONLY IMPORTED ON FIRST ATTRIBUTE ACCESS, SO
+    HEAVY DEPENDENCIES (PANDAS, NUMPY) COST NOTHING UNTIL THEY ARE USED.
+    THE IMPORT RUNS UNDER A LOCK, SO THREADS NEVER SEE A HALF-LOADED MODULE.
+    """
+    if name in modules:
+        return modules[name]
+    if find_spec(name) is None:
+        raise ImportError("No module named " + repr(name))
+    return _LazyModule(name)
+
+
 def pretty_print(dataframe, showindex=True, tablefmt="presto"):
     """PRINT A TABULAR DATAFRAME."""
+    from tabulate import tabulate
     print(tabulate(dataframe, showindex=showindex, tablefmt=tablefmt,
                    headers="keys"))
 
@@ -89,9 +123,50 @@ yml_location = join(Path(abspath(__file__)).parent.parent,
                     "config", "config.yml")
 argument_yml = join(Path(abspath(__file__)).parent.parent,
                     "config", "arguments.yml")
+schema_yml = join(Path(abspath(__file__)).parent.parent,
+                  "config", "schema.yml")
+jobs_yml = join(Path(abspath(__file__)).parent.parent,
+                "config", "jobs.yml")
+
+
+_env_pattern = compile(r".*?\${(\w+)}.*?")
+_yml_cache = dict()
+_yml_cache_lock = Lock()
+
+
+def _env_var_constructor(loader, node):
+    """
+    Extracts the environment variable from the node's value
+    :param yaml.Loader loader: the yaml loader
+    :param node: the current node in the yaml
+    :return: the parsed string that contains the value of the environment
+    variable
+    """
+    value = loader.construct_scalar(node=node)
+    match = _env_pattern.findall(string=value)
+    if match:
+        full_value = value
+        for g in match:
+            full_value = full_value.replace(
+                "${{{key}}}".format(key=g), environ.get(key=g, default=g))
+        return full_value
+    return value
+
+
+@lru_cache(maxsize=None)
+def _env_loader(tag=None):
+    """
+    A SafeLoader subclass resolving ${VAR} scalars, built once per tag so
+    the global SafeLoader (used by every other YAML load) is untouched.
+    """
+    tag = tag or "!env"
+    loader = type("EnvLoader", (SafeLoader,), {})
+    loader.add_implicit_resolver(tag=tag, regexp=_env_pattern, first=None)
+    loader.add_constructor(tag=tag, constructor=_env_var_constructor)
+    return loader
 
 
-def yml(file_path=yml_location, data=None, tag=None):
+def yml(file_path=yml_location, data=None, tag=None, cache=True):
     """
     Load a yaml configuration file (path) or data object(data)
     and resolve any environment variables. The environment
@@ -104,47 +179,257 @@ def yml(file_path=yml_location, data=None, tag=None):
     app:
         log_path: "/var/${LOG_PATH}"
         something_else: "${AWESOME_ENV_VAR}/var/${A_SECOND_AWESOME_VAR}"
+
+    Parsed files are cached by path and modification time, so repeated
+    calls are cheap; treat the returned dict as read-only, or pass
+    cache=False for a private copy.
     :param str file_path: the path to the yaml file
     :param str data: the yaml data itself as a stream
     :param str tag: the tag to look for
+    :param bool cache: reuse the parsed file while it is unchanged
     :return: the dict configuration
     :rtype: dict[str, T]
     """
     if "arguments" in str(file_path).lower():
         file_path = argument_yml
-    pattern = compile(r".*?\${(\w+)}.*?")
-    loader = SafeLoader
-    loader.add_implicit_resolver(tag=tag, regexp=pattern, first=None)
-
-    def env_var_constructor(loader, node):
-        """
-        Extracts the environment variable from the node's value
-        :param yaml.Loader loader: the yaml loader
-        :param node: the current node in the yaml
-        :return: the parsed string that contains the value of the environment
-        variable
-        """
-        value = loader.construct_scalar(node=node)
-        match = pattern.findall(string=value)
-        if match:
-            full_value = value
-            for g in match:
-                full_value = full_value.replace(
-                    "${{{key}}}".format(key=g), environ.get(key=g, default=g))
-            return full_value
-        return value
-
-    loader.add_constructor(tag=tag, constructor=env_var_constructor)
-
+    loader = _env_loader(tag)
     if file_path:
-        with open(file_path) as conf_data:
-            return load(stream=conf_data, Loader=loader)
+        if not cache:
+            with open(file_path) as conf_data:
+                return load(stream=conf_data, Loader=loader)
+        key = (abspath(file_path), tag)
+        mtime = stat(file_path).st_mtime_ns
+        with _yml_cache_lock:
+            cached = _yml_cache.get(key)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            with open(file_path) as conf_data:
+                config = load(stream=conf_data, Loader=loader)
+            _yml_cache[key] = (mtime, config)
+        return config
     elif data:
         return load(stream=data, Loader=loader)
     else:
         raise ValueError("Either a path or data should be defined as input")
 
 
+def watch_yml(callback, file_path=yml_location, interval=1.0, tag=None):
+    """
+    Call callback(config) from a daemon thread whenever the yaml file
+    changes on disk.
+
+    Example:
+        stop = watch_yml(lambda config: print(config["sql"]))
+        ...
+        stop.set()
+    :param callable callback: receives the newly parsed config
+    :param str file_path: the path to the yaml file
+    :param float interval: seconds between modification time checks
+    :param str tag: the tag to look for
+    :return: a threading.Event, set it to stop watching
+    """
+    stop = Event()
+
+    def watch():
+        last = stat(file_path).st_mtime_ns
+        while not stop.wait(interval):
+            try:
+                mtime = stat(file_path).st_mtime_ns
+            except OSError:
+                continue
+            if mtime != last:
+                last = mtime
+                callback(yml(file_path, tag=tag))
+
+    Thread(target=watch, name="watch_yml", daemon=True).start()
+    return stop
+
+
+def _share(dataframe):
+    """
+    PUT A CHUNK IN SHARED MEMORY AS AN ARROW IPC STREAM.
+    :return: ("arrow", block name, size) or, when Arrow or shared memory is
+        unavailable or cannot type a column, ("pickle", dataframe)
+    """
+    try:
+        from multiprocessing.shared_memory import SharedMemory
+        import pyarrow
+        table = pyarrow.Table.from_pandas(dataframe, preserve_index=True)
+    except ImportError:
+        return "pickle", dataframe
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError,
+            pyarrow.ArrowNotImplementedError):
+        return "pickle", dataframe
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    data = sink.getvalue()
+    block = SharedMemory(create=True, size=max(data.size, 1))
+    try:
+        block.buf[:data.size] = memoryview(data).cast("B")
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    name = block.name
+    block.close()
+    return "arrow", name, data.size
+
+
+def _unshare(shared, unlink=False):
+    """READ A CHUNK WRITTEN BY `_share`; LIST COLUMNS COME BACK AS LISTS."""
+    if shared[0] == "pickle":
+        return shared[1]
+    from multiprocessing.shared_memory import SharedMemory
+    import pyarrow
+    _, name, size = shared
+    block = SharedMemory(name=name)
+    try:
+        table = pyarrow.ipc.open_stream(
+            pyarrow.py_buffer(block.buf[:size])).read_all()
+        dataframe = table.to_pandas()
+        for position, field in enumerate(table.schema):
+            if pyarrow.types.is_list(field.type) and \
+                    field.name in dataframe:
+                dataframe[field.name] = table.column(position).to_pylist()
+        del table
+    finally:
+        block.close()
+        if unlink:
+            block.unlink()
+    return dataframe
+
+
+_inherited = dict()
+
+
+def _run_pipeline(steps, dataframe):
+    """APPLY (FUNCTION, KWARGS) STEPS IN ORDER."""
+    for function, kwargs in steps:
+        dataframe = function(dataframe, **kwargs)
+    return dataframe
+
+
+def _run_chunk(steps, source, start=None, stop=None):
+    """
+    PROCESS POOL WORKER. `source` IS EITHER THE KEY OF A FRAME INHERITED
+    FROM THE PARENT BY fork, SLICED TO [start:stop], OR A SHARED CHUNK.
+    """
+    if isinstance(source, tuple):
+        dataframe = _unshare(source, unlink=True)
+    else:
+        dataframe = _inherited[source].iloc[start:stop]
+    return _run_pipeline(steps, dataframe)
+
+
+def _release(shared):
+    """UNLINK SHARED CHUNKS A FAILED RUN LEFT BEHIND."""
+    from multiprocessing.shared_memory import SharedMemory
+    for chunk in shared:
+        if chunk[0] != "arrow":
+            continue
+        try:
+            block = SharedMemory(name=chunk[1])
+        except OSError:
+            continue
+        block.close()
+        block.unlink()
+
+
+class TransformExecutor:
+    """
+    RUN A PIPELINE OF ROW-LOCAL DATAFRAME TRANSFORMS OVER CHUNKS OF A FRAME
+    ACROSS A PROCESS POOL AND STITCH THE RESULTS BACK IN ORDER.
+
+    WITH THE fork START METHOD THE WORKERS INHERIT THE INPUT FRAME AND SLICE
+    THEIR OWN CHUNKS, SO THE PARENT SERIALIZES NOTHING ON THE WAY OUT;
+    OTHERWISE CHUNKS TRAVEL AS ARROW IPC STREAMS IN SHARED MEMORY. RESULTS
+    COME BACK PICKLED AND ARE CONCATENATED, WHICH COSTS THE PARENT ABOUT AS
+    MUCH AS A CHEAP VECTORIZED PIPELINE TAKES TO RUN SERIALLY: THE POOL ONLY
+    PAYS OFF FOR PIPELINES DOING REAL PER-ROW PYTHON WORK ON MULTI-CORE
+    HOSTS, SO MEASURE WITH benchmarks/transforms.py BEFORE USING `run`.
+
+    EVERY STEP MUST BE A MODULE-LEVEL FUNCTION TAKING AND RETURNING A
+    DATAFRAME AND MUST NOT DEPEND ON ROWS OUTSIDE ITS CHUNK. SMALL FRAMES,
+    ONE WORKER, OR A POOL THAT CANNOT START RUN SERIALLY IN THIS PROCESS.
+    SCRIPTS CALLING `run` NEED AN `if __name__ == "__main__"` GUARD ON
+    PLATFORMS THAT SPAWN WORKERS (macOS, WINDOWS).
+
+    Example:
+        executor = TransformExecutor(workers=4)
+        executor.register(merge_languages, sheet_yaml=sheet_yaml)
+        executor.register(parse_needs, sheet_yaml=sheet_yaml)
+        requests_df = executor.run_serial(request_df)
+    """
+
+    def __init__(self, workers=None, chunksize=5000, min_rows=None):
+        """
+        :param int workers: worker processes, default os.cpu_count()
+        :param int chunksize: rows per chunk
+        :param int min_rows: frames shorter than this run serially,
+            default two chunks
+        """
+        from os import cpu_count
+        self.workers = workers or cpu_count() or 1
+        self.chunksize = chunksize
+        self.min_rows = min_rows if min_rows is not None else 2 * chunksize
+        self.steps = []
+
+    def register(self, function, **kwargs):
+        """APPEND `function(dataframe, **kwargs)` TO THE PIPELINE."""
+        self.steps.append((function, kwargs))
+        return self
+
+    def run_serial(self, dataframe):
+        """RUN THE WHOLE PIPELINE IN THIS PROCESS."""
+        return _run_pipeline(self.steps, dataframe)
+
+    def run(self, dataframe):
+        """
+        RUN THE PIPELINE ON THE PROCESS POOL WHEN THE FRAME IS LARGE ENOUGH.
+        :return: the transformed frame, chunks in their original order
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+        from logging import getLogger
+        from multiprocessing import get_start_method
+        from pickle import PicklingError
+        from uuid import uuid4
+        if self.workers <= 1 or len(dataframe) < max(self.min_rows, 1):
+            return self.run_serial(dataframe)
+        import pandas
+        bounds = [(start, start + self.chunksize)
+                  for start in range(0, len(dataframe), self.chunksize)]
+        inherit = get_start_method() == "fork"
+        key = uuid4().hex
+        shared = []
+        try:
+            if inherit:
+                _inherited[key] = dataframe
+            with ProcessPoolExecutor(self.workers) as pool:
+                if inherit:
+                    futures = [pool.submit(_run_chunk, self.steps, key,
+                                           start, stop)
+                               for start, stop in bounds]
+                else:
+                    shared = [_share(dataframe.iloc[start:stop])
+                              for start, stop in bounds]
+                    futures = [pool.submit(_run_chunk, self.steps, chunk)
+                               for chunk in shared]
+                frames = [future.result() for future in futures]
+        except BaseException as error:
+            _release(shared)
+            if not isinstance(error, (BrokenProcessPool, OSError,
+                                      PicklingError, AttributeError)):
+                raise
+            getLogger(__name__).warning(
+                "Process pool unavailable (%s), running serially", error)
+            return self.run_serial(dataframe)
+        finally:
+            _inherited.pop(key, None)
+        return pandas.concat(frames)
+
+
 class Arguments:
     """CREATE AN ARGUMENT PARSER FROM A DICTIONARY.
     USE A LONG ARGUMENT AND A SHORT ARGUMENT (SINGLE LETTER) WILL
@@ -226,6 +511,3 @@ class LOG_LEVEL:
     INFO = 20
     DEBUG = 10
 
-
-logger(level="info", timestamp=True, filename=None,
-       custom_format=None, inherit_env=True)
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+
+"""
+LOCAL STAND-INS FOR THE AIRTABLE REST API AND THE GOOGLE SHEETS V4 API.
+
+BOTH SERVERS KEEP THEIR DATA IN MEMORY, COUNT EVERY REQUEST AND RUN ON A
+BACKGROUND THREAD, SO BENCHMARKS CAN EXERCISE FRMAN WITHOUT NETWORK ACCESS.
+
+    airtable = FakeAirtable(rate=5).start()
+    airtable.seed("appBench", "Requests", records)
+    client = Airtable("appBench", "Requests", "key", api_url=airtable.url)
+
+    sheets = FakeSheets().start()
+    sheets.add_spreadsheet("sheet1", ["Requests"])
+    client = Sheets(token, None, transport=sheets.transport)
+"""
+
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from re import compile
+from threading import Lock, Thread
+from time import monotonic
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from httplib2 import Http
+
+MAX_BATCH = 10
+PAGE_SIZE = 100
+
+
+class _Server:
+    """A THREADED HTTP SERVER ON A FREE LOCALHOST PORT."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = defaultdict(int)
+        self.httpd = None
+
+    def start(self):
+        """START SERVING FROM A DAEMON THREAD."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = loads(self.rfile.read(length)) if length else None
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                with server.lock:
+                    server.requests[self.command] += 1
+                status, payload, headers = server.handle(
+                    self.command, unquote(parts.path), query, body)
+                data = dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _dispatch
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """SHUT THE SERVER DOWN."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.httpd.server_address[1])
+
+    def request_count(self, reset=False):
+        """TOTAL REQUESTS SERVED, OPTIONALLY RESETTING THE COUNTERS."""
+        with self.lock:
+            total = sum(self.requests.values())
+            if reset:
+                self.requests.clear()
+        return total
+
+    def handle(self, method, path, query, body):
+        raise NotImplementedError
+
+
+class FakeAirtable(_Server):
+    """
+    AIRTABLE REST API: PAGINATED LISTS (pageSize/offset/maxRecords/fields[]),
+    SINGLE AND 10-RECORD BATCH CREATE/UPDATE/DELETE, AND A PER-BASE TOKEN
+    BUCKET OF `rate` REQUESTS PER SECOND THAT ANSWERS 429 WHEN EXCEEDED.
+    """
+
+    def __init__(self, rate=5):
+        super().__init__()
+        self.rate = rate
+        self.tables = defaultdict(dict)
+        self.buckets = dict()
+        self.throttled = 0
+        self.next_id = 0
+
+    def seed(self, base, table, records):
+        """REPLACE A TABLE WITH `records` (FIELD DICTS)."""
+        with self.lock:
+            self.tables[(base, table)] = dict()
+            for fields in records:
+                self._create(base, table, fields)
+
+    def _create(self, base, table, fields):
+        self.next_id += 1
+        record = {"id": "rec{:014d}".format(self.next_id),
+                  "createdTime": "2020-04-01T00:00:00.000Z",
+                  "fields": dict(fields)}
+        self.tables[(base, table)][record["id"]] = record
+        return record
+
+    def _allow(self, base):
+        """TOKEN BUCKET CHECK FOR ONE REQUEST AGAINST `base`."""
+        if not self.rate:
+            return True
+        now = monotonic()
+        tokens, updated = self.buckets.get(base, (float(self.rate), now))
+        tokens = min(float(self.rate), tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        self.buckets[base] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    def handle(self, method, path, query, body):
+        parts = path.strip("/").split("/")
+        if len(parts) < 3 or parts[0] != "v0":
+            return 404, {"error": "NOT_FOUND"}, {}
+        base, table = parts[1], parts[2]
+        record_id = parts[3] if len(parts) > 3 else None
+        with self.lock:
+            if not self._allow(base):
+                self.throttled += 1
+                return 429, {"errors": [{"error": "RATE_LIMIT_REACHED"}]}, {}
+            records = self.tables[(base, table)]
+            if method == "GET":
+                return self._list(records, query)
+            if record_id is not None:
+                return self._single(base, table, method, record_id, body)
+            if method == "DELETE":
+                ids = query.get("records[]", [])
+                if len(ids) > MAX_BATCH:
+                    return 422, {"error": "INVALID_RECORDS"}, {}
+                return 200, {"records": [
+                    {"id": rid, "deleted": records.pop(rid, None) is not None}
+                    for rid in ids]}, {}
+            batch = body.get("records", [])
+            if len(batch) > MAX_BATCH:
+                return 422, {"error": "INVALID_RECORDS"}, {}
+            if method == "POST":
+                return 200, {"records": [
+                    self._create(base, table, item["fields"])
+                    for item in batch]}, {}
+            updated = []
+            for item in batch:
+                record = records.get(item["id"])
+                if record is None:
+                    return 404, {"error": "NOT_FOUND"}, {}
+                record["fields"].update(item["fields"])
+                updated.append(record)
+            return 200, {"records": updated}, {}
+
+    def _list(self, records, query):
+        offset = int(query.get("offset", ["0"])[0] or 0)
+        page_size = min(int(query.get("pageSize", [PAGE_SIZE])[0]),
+                        PAGE_SIZE)
+        limit = int(query.get("maxRecords", [len(records)])[0])
+        fields = query.get("fields[]") or query.get("fields")
+        rows = list(records.values())[:limit]
+        page = rows[offset:offset + page_size]
+        if fields:
+            page = [dict(record, fields={
+                name: value for name, value in record["fields"].items()
+                if name in fields}) for record in page]
+        payload = {"records": page}
+        if offset + page_size < len(rows):
+            payload["offset"] = str(offset + page_size)
+        return 200, payload, {}
+
+    def _single(self, base, table, method, record_id, body):
+        records = self.tables[(base, table)]
+        if method == "DELETE":
+            records.pop(record_id, None)
+            return 200, {"id": record_id, "deleted": True}, {}
+        record = records.get(record_id)
+        if record is None:
+            return 404, {"error": "NOT_FOUND"}, {}
+        record["fields"].update(body.get("fields", {}))
+        return 200, record, {}
+
+
+_a1 = compile(r"^([A-Z]*)(\d*)$")
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+def _column_letter(number):
+    letters = ""
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class LocalHttp(Http):
+    """httplib2 TRANSPORT THAT SENDS EVERY GOOGLE API CALL TO `base_url`."""
+
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url
+
+    def request(self, uri, *args, **kwargs):
+        parts = urlsplit(uri)
+        local = self.base_url + parts.path
+        if parts.query:
+            local += "?" + parts.query
+        return super().request(local, *args, **kwargs)
+
+
+class FakeSheets(_Server):
+    """
+    GOOGLE SHEETS V4: SPREADSHEET METADATA, spreadsheets.batchUpdate
+    (updateCells, appendDimension, updateSheetProperties) AND THE values
+    API (get, batchGet, update, batchUpdate, append, clear, batchClear).
+    """
+
+    def __init__(self, rows=1000, columns=26):
+        super().__init__()
+        self.rows = rows
+        self.columns = columns
+        self.spreadsheets = dict()
+
+    def transport(self):
+        """NEW httplib2 TRANSPORT POINTED AT THIS SERVER."""
+        return LocalHttp(self.url)
+
+    def add_spreadsheet(self, spreadsheet_id, titles=("Sheet1",)):
+        """CREATE AN EMPTY SPREADSHEET WITH THE GIVEN WORKSHEETS."""
+        with self.lock:
+            self.spreadsheets[spreadsheet_id] = [
+                {"id": index, "title": title, "cells": dict(),
+                 "rows": self.rows, "columns": self.columns}
+                for index, title in enumerate(titles)]
+
+    def values(self, spreadsheet_id, title=None):
+        """CURRENT GRID CONTENT OF A WORKSHEET AS A LIST OF ROWS."""
+        sheet = self._sheet(spreadsheet_id, title)
+        return self._read(sheet, 1, 1, sheet["rows"], sheet["columns"])
+
+    def _sheet(self, spreadsheet_id, title=None, sheet_id=None):
+        for sheet in self.spreadsheets[spreadsheet_id]:
+            if (title is None and sheet_id is None) or \
+                    sheet["title"] == title or sheet["id"] == sheet_id:
+                return sheet
+        raise KeyError(title or sheet_id)
+
+    def _range(self, spreadsheet_id, a1):
+        """PARSE 'Title'!A1:B2 INTO (SHEET, ROW1, COL1, ROW2, COL2)."""
+        title = None
+        if "!" in a1:
+            title, a1 = a1.rsplit("!", 1)
+            title = title.strip("'").replace("''", "'")
+        elif not _a1.match(a1.split(":")[0]):
+            title, a1 = a1.strip("'").replace("''", "'"), ""
+        sheet = self._sheet(spreadsheet_id, title)
+        start, _, end = a1.partition(":")
+        first = _a1.match(start or "A1")
+        last = _a1.match(end or start) if (end or start) else None
+        row1 = int(first.group(2) or 1)
+        col1 = _column_number(first.group(1) or "A")
+        row2 = int(last.group(2)) if last and last.group(2) \
+            else sheet["rows"]
+        col2 = _column_number(last.group(1)) if last and last.group(1) \
+            else sheet["columns"]
+        return sheet, row1, col1, row2, col2
+
+    @staticmethod
+    def _read(sheet, row1, col1, row2, col2):
+        rows = []
+        for row in range(row1, row2 + 1):
+            values = [sheet["cells"].get((row, column), "")
+                      for column in range(col1, col2 + 1)]
+            while values and values[-1] == "":
+                values.pop()
+            rows.append(values)
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    @staticmethod
+    def _write(sheet, row1, col1, values):
+        for row_offset, row in enumerate(values):
+            for column_offset, value in enumerate(row):
+                key = (row1 + row_offset, col1 + column_offset)
+                if value in ("", None):
+                    sheet["cells"].pop(key, None)
+                else:
+                    sheet["cells"][key] = value
+        sheet["rows"] = max(sheet["rows"], row1 + len(values) - 1)
+
+    @staticmethod
+    def _clear(sheet, row1, col1, row2, col2):
+        for key in [key for key in sheet["cells"]
+                    if row1 <= key[0] <= row2 and col1 <= key[1] <= col2]:
+            del sheet["cells"][key]
+
+    @staticmethod
+    def _a1_of(sheet, row1, col1, row2, col2):
+        title = sheet["title"]
+        if not title.isalnum():
+            title = "'" + title.replace("'", "''") + "'"
+        return "{}!{}{}:{}{}".format(title, _column_letter(col1), row1,
+                                     _column_letter(col2), row2)
+
+    def _metadata(self, spreadsheet_id):
+        return {"spreadsheetId": spreadsheet_id,
+                "properties": {"title": spreadsheet_id, "defaultFormat": {}},
+                "namedRanges": [],
+                "sheets": [{"properties": {
+                    "sheetId": sheet["id"], "title": sheet["title"],
+                    "index": sheet["id"], "sheetType": "GRID",
+                    "gridProperties": {"rowCount": sheet["rows"],
+                                       "columnCount": sheet["columns"]}}}
+                    for sheet in self.spreadsheets[spreadsheet_id]]}
+
+    def handle(self, method, path, query, body):
+        if "discovery" in path or "$discovery" in path:
+            from os.path import dirname, join
+            import pygsheets
+            with open(join(dirname(pygsheets.__file__), "data",
+                           "sheets_discovery.json")) as document:
+                return 200, loads(document.read()), {}
+        parts = path.split("/v4/spreadsheets/", 1)
+        if len(parts) != 2:
+            return 404, {"error": "NOT_FOUND"}, {}
+        rest = parts[1]
+        spreadsheet_id, _, rest = rest.partition("/")
+        spreadsheet_id, _, action = spreadsheet_id.partition(":")
+        with self.lock:
+            if spreadsheet_id not in self.spreadsheets:
+                return 404, {"error": {"code": 404}}, {}
+            if not rest:
+                if action == "batchUpdate":
+                    for request in body.get("requests", []):
+                        self._batch_request(spreadsheet_id, request)
+                    return 200, {"spreadsheetId": spreadsheet_id,
+                                 "replies": [{} for _ in
+                                             body.get("requests", [])]}, {}
+                return 200, self._metadata(spreadsheet_id), {}
+            return self._values(spreadsheet_id, method, rest, query, body)
+
+    def _batch_request(self, spreadsheet_id, request):
+        if "updateCells" in request:
+            grid = request["updateCells"].get("range", {})
+            sheet = self._sheet(spreadsheet_id,
+                                sheet_id=grid.get("sheetId", 0))
+            self._clear(sheet, grid.get("startRowIndex", 0) + 1,
+                        grid.get("startColumnIndex", 0) + 1,
+                        grid.get("endRowIndex", sheet["rows"]),
+                        grid.get("endColumnIndex", sheet["columns"]))
+        elif "appendDimension" in request:
+            append = request["appendDimension"]
+            sheet = self._sheet(spreadsheet_id, sheet_id=append["sheetId"])
+            size = "rows" if append["dimension"] == "ROWS" else "columns"
+            sheet[size] += append["length"]
+        elif "updateSheetProperties" in request:
+            properties = request["updateSheetProperties"]["properties"]
+            sheet = self._sheet(spreadsheet_id,
+                                sheet_id=properties.get("sheetId", 0))
+            grid = properties.get("gridProperties", {})
+            sheet["rows"] = grid.get("rowCount", sheet["rows"])
+            sheet["columns"] = grid.get("columnCount", sheet["columns"])
+
+    def _values(self, spreadsheet_id, method, rest, query, body):
+        if rest.startswith("values:"):
+            action = rest[len("values:"):]
+            if action == "batchGet":
+                return 200, {"spreadsheetId": spreadsheet_id, "valueRanges": [
+                    self._get(spreadsheet_id, a1)
+                    for a1 in query.get("ranges", [])]}, {}
+            if action == "batchUpdate":
+                for item in body.get("data", []):
+                    sheet, row1, col1, _, _ = self._range(
+                        spreadsheet_id, item["range"])
+                    self._write(sheet, row1, col1, item.get("values", []))
+                return 200, {"spreadsheetId": spreadsheet_id}, {}
+            if action == "batchClear":
+                for a1 in body.get("ranges", []):
+                    self._clear(*self._range(spreadsheet_id, a1))
+                return 200, {"spreadsheetId": spreadsheet_id}, {}
+            return 404, {"error": "NOT_FOUND"}, {}
+        a1 = rest[len("values/"):]
+        action = ""
+        for suffix in (":append", ":clear"):
+            if a1.endswith(suffix):
+                a1, action = a1[:-len(suffix)], suffix[1:]
+        if action == "append":
+            return self._append(spreadsheet_id, a1, body)
+        if action == "clear":
+            self._clear(*self._range(spreadsheet_id, a1))
+            return 200, {"spreadsheetId": spreadsheet_id}, {}
+        if method == "PUT":
+            sheet, row1, col1, _, _ = self._range(spreadsheet_id, a1)
+            self._write(sheet, row1, col1, body.get("values", []))
+            return 200, {"spreadsheetId": spreadsheet_id}, {}
+        return 200, self._get(spreadsheet_id, a1), {}
+
+    def _get(self, spreadsheet_id, a1):
+        sheet, row1, col1, row2, col2 = self._range(spreadsheet_id, a1)
+        values = self._read(sheet, row1, col1, row2, col2)
+        result = {"range": self._a1_of(sheet, row1, col1, row2, col2),
+                  "majorDimension": "ROWS"}
+        if values:
+            result["values"] = values
+        return result
+
+    def _append(self, spreadsheet_id, a1, body):
+        sheet, row1, col1, row2, col2 = self._range(spreadsheet_id, a1)
+        last = row1 - 1
+        for row, column in sheet["cells"]:
+            if col1 <= column <= col2 and row >= row1:
+                last = max(last, row)
+        values = body.get("values", [])
+        width = max([len(row) for row in values] or [1])
+        self._write(sheet, last + 1, col1, values)
+        table = self._a1_of(sheet, row1, col1, max(last, row1),
+                            col1 + width - 1)
+        updated = self._a1_of(sheet, last + 1, col1, last + len(values),
+                              col1 + width - 1)
+        return 200, {"spreadsheetId": spreadsheet_id, "tableRange": table,
+                     "updates": {"spreadsheetId": spreadsheet_id,
+                                 "updatedRange": updated,
+                                 "updatedRows": len(values),
+                                 "updatedColumns": width,
+                                 "updatedCells": len(values) * width}}, {}
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""
+IMPORT-TIME BUDGET CHECK FOR THE FRMAN PACKAGE.
+
+EACH MODULE IS IMPORTED IN A FRESH INTERPRETER WITH `python -X importtime`
+AND ITS CUMULATIVE IMPORT TIME (BEST OF A FEW RUNS) IS COMPARED TO A BUDGET.
+EXITS NON-ZERO WHEN A MODULE IS OVER BUDGET.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 10 --budget 2.0
+"""
+
+from os.path import abspath, dirname
+from re import compile
+from subprocess import run
+from sys import executable, exit, path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from FRMAN.Utils import Arguments  # noqa: E402
+
+# MILLISECONDS; HEAVY DEPENDENCIES (PANDAS, SQLALCHEMY, GOOGLE CLIENTS)
+# MUST NOT BE IMPORTED UNTIL THEY ARE USED.
+BUDGETS = {
+    "FRMAN.Utils": 100,
+    "FRMAN.SQL": 120,
+    "FRMAN.Airtable": 120,
+    "FRMAN.Sheets": 150,
+    "FRMAN.Needs": 120,
+    "FRMAN.Transforms": 120,
+}
+
+_line = compile(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)")
+
+
+def import_time(module):
+    """CUMULATIVE IMPORT TIME OF `module` IN MILLISECONDS."""
+    result = run([executable, "-X", "importtime", "-c", "import " + module],
+                 capture_output=True, text=True,
+                 cwd=dirname(dirname(abspath(__file__))))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    for line in reversed(result.stderr.splitlines()):
+        match = _line.match(line)
+        if match and match.group(2) == module:
+            return int(match.group(1)) / 1000
+    raise RuntimeError("No import time reported for " + module)
+
+
+def main():
+    """MEASURE EVERY MODULE AND REPORT AGAINST ITS BUDGET."""
+    arguments = Arguments({
+        "application": "import_time",
+        "version": "1.0",
+        "description": "FRMAN import-time budget check",
+        "arguments": [
+            {"arg": "runs", "action": "store", "dest": "runs",
+             "default": 5, "help": "Imports per module, best is kept"},
+            {"arg": "budget", "action": "store", "dest": "budget",
+             "default": 1.0, "help": "Multiplier applied to every budget"},
+        ]}).parse()
+    runs = int(arguments["runs"])
+    scale = float(arguments["budget"])
+    failed = False
+    for module, budget in BUDGETS.items():
+        best = min(import_time(module) for _ in range(runs))
+        limit = budget * scale
+        status = "ok" if best <= limit else "OVER"
+        failed = failed or best > limit
+        print("{:<18} {:>8.1f} ms  (budget {:>6.1f} ms)  {}".format(
+            module, best, limit, status))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""
+OFFLINE THROUGHPUT BENCHMARKS FOR THE AIRTABLE, SHEETS AND SQL CLASSES.
+
+EXTRACT, INGEST, BACKUP AND APPEND PATHS RUN AGAINST THE LOCAL FAKE SERVERS
+IN fake_servers.py AT SEVERAL DATA SIZES, REPORTING ROWS/SEC, REQUESTS MADE
+AND PEAK TRACED MEMORY FOR EACH.
+
+    python benchmarks/throughput.py
+    python benchmarks/throughput.py --sizes 1000,10000 --output bench.json
+"""
+
+from datetime import date, timedelta
+from json import dump
+from os.path import abspath, dirname, join
+from pickle import dump as pkdump
+from sys import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from fake_servers import FakeAirtable, FakeSheets  # noqa: E402
+from FRMAN.Airtable import Airtable, get_tables  # noqa: E402
+from FRMAN.SQL import SQL  # noqa: E402
+from FRMAN.Sheets import Sheets  # noqa: E402
+from FRMAN.Utils import Arguments, lazy_import, pretty_print  # noqa: E402
+
+pandas = lazy_import("pandas")
+
+BASE = "appBenchmark"
+TABLE = "Requests"
+TABLES = {"requests": (BASE, TABLE),
+          "volunteers": ("appBenchmarkB", "Volunteers"),
+          "deliveries": ("appBenchmarkC", "Deliveries")}
+SPREADSHEET = "benchmark"
+NEEDS = ["Someone to buy me food/groceries",
+         "Someone to deliver food/groceries", "Childcare", "Money"]
+
+
+def intake_records(size):
+    """SYNTHETIC INTAKE-FORM RECORDS."""
+    return [{"Name": "Neighbor {}".format(row),
+             "Email": "neighbor{}@example.org".format(row),
+             "Zip": str(98100 + row % 90),
+             "What do you need?": ", ".join(NEEDS[:1 + row % len(NEEDS)]),
+             "Notes": "Request number {} ".format(row) * (1 + row % 3)}
+            for row in range(size)]
+
+
+def intake_frame(size):
+    """SYNTHETIC INTAKE-FORM FRAME WITH A KEY AND DATE COLUMN."""
+    dataframe = pandas.DataFrame(intake_records(size))
+    dataframe.insert(0, "id", ["req{:08d}".format(row) for row in range(size)])
+    dataframe.insert(1, "Date", [date(2020, 4, 1) + timedelta(days=row % 60)
+                                 for row in range(size)])
+    return dataframe
+
+
+def measure(name, rows, function, servers=()):
+    """RUN ONE BENCHMARK CASE AND RETURN ITS MEASUREMENTS."""
+    for server in servers:
+        server.request_count(reset=True)
+    start()
+    began = perf_counter()
+    function()
+    seconds = perf_counter() - began
+    peak = get_traced_memory()[1]
+    stop()
+    return {"path": name, "rows": rows, "seconds": round(seconds, 3),
+            "rows_per_sec": round(rows / seconds) if seconds else None,
+            "requests": sum(server.request_count() for server in servers),
+            "peak_mb": round(peak / 2 ** 20, 1)}
+
+
+def run(sizes, rate, workdir):
+    """RUN EVERY CASE AT EVERY SIZE."""
+    from google.oauth2.credentials import Credentials
+    airtable_server = FakeAirtable(rate=rate).start()
+    sheets_server = FakeSheets().start()
+    token = join(workdir, "token.pkl")
+    with open(token, "wb") as gtoken:
+        pkdump(Credentials(token="benchmark"), gtoken)
+    sheets = Sheets(token, None, transport=sheets_server.transport)
+    results = []
+    try:
+        for size in sizes:
+            for base, table in TABLES.values():
+                airtable_server.seed(base, table, intake_records(size))
+            sheets_server.add_spreadsheet(SPREADSHEET, ["Backup", "Log"])
+            sheets.refresh()
+            api_url = airtable_server.url + "/v0"
+            airtable = Airtable(BASE, TABLE, "benchmark", api_url=api_url)
+            sql = SQL(join(workdir, "benchmark_{}.sqlite".format(size)))
+            dataframe = intake_frame(size)
+            changed = dataframe.copy()
+            changed.loc[::100, "Notes"] = "edited"
+            values = dataframe.astype(str).values.tolist()
+            cases = [
+                ("airtable extract", lambda: airtable.get_airtable_raw(),
+                 [airtable_server]),
+                ("airtable extract streamed", lambda: [
+                    len(chunk) for chunk in airtable.iter_airtable_raw()],
+                 [airtable_server]),
+                ("airtable extract 3 tables sequential", lambda: [
+                    Airtable(base, table, "benchmark",
+                             api_url=api_url).get_airtable_raw()
+                    for base, table in TABLES.values()], [airtable_server]),
+                ("airtable extract 3 tables async", lambda: get_tables(
+                    TABLES, "benchmark", api_url=api_url), [airtable_server]),
+                ("sql ingest replace", lambda: sql.ingest_df(
+                    dataframe, "requests", if_exists="replace"), []),
+                ("sql upsert", lambda: sql.upsert_df(
+                    changed, "requests", "id"), []),
+                ("sheets backup full", lambda: sheets.backup_to_sheet(
+                    SPREADSHEET, dataframe.copy(), sheet_name="Backup"),
+                 [sheets_server]),
+                ("sheets backup 1% changed", lambda: sheets.backup_to_sheet(
+                    SPREADSHEET, changed.copy(), sheet_name="Backup",
+                    key="id"), [sheets_server]),
+                ("sheets append", lambda: sheets.append(
+                    values, SPREADSHEET, sheet_name="Log"),
+                 [sheets_server]),
+            ]
+            for name, function, servers in cases:
+                rows = size * len(TABLES) if "3 tables" in name else size
+                results.append(measure(name, rows, function, servers))
+            sql.engine.dispose()
+    finally:
+        airtable_server.stop()
+        sheets_server.stop()
+    return results
+
+
+def main():
+    """PARSE ARGUMENTS, RUN AND REPORT."""
+    arguments = Arguments({
+        "application": "throughput",
+        "version": "1.0",
+        "description": "FRMAN offline throughput benchmarks",
+        "arguments": [
+            {"arg": "sizes", "action": "store", "dest": "sizes",
+             "default": "1000,5000", "help": "Comma separated row counts"},
+            {"arg": "rate", "action": "store", "dest": "rate",
+             "default": 5, "help": "Fake Airtable requests/sec, 0 = none"},
+            {"arg": "output", "action": "store", "dest": "output",
+             "default": None, "help": "Also write results to this JSON file"},
+        ]}).parse()
+    sizes = [int(size) for size in str(arguments["sizes"]).split(",")]
+    with TemporaryDirectory() as workdir:
+        results = run(sizes, float(arguments["rate"]), workdir)
+    pretty_print(pandas.DataFrame(results), showindex=False)
+    if arguments["output"]:
+        with open(arguments["output"], "w") as output:
+            dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""
+SERIAL VS CHUNK-PARALLEL REQUEST CLEANING.
+
+RUNS THE playground.py CLEANING PIPELINE (merge_languages -> parse_needs ->
+join_columns) OVER SYNTHETIC BILINGUAL INTAKE DATA, ONCE IN-PROCESS AND
+ONCE THROUGH `TransformExecutor`, CHECKING BOTH GIVE THE SAME FRAME.
+
+    python benchmarks/transforms.py
+    python benchmarks/transforms.py --sizes 100000 --workers 8
+"""
+
+from os import cpu_count
+from os.path import abspath, dirname
+from sys import path
+from time import perf_counter
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from throughput import NEEDS, intake_records  # noqa: E402
+from FRMAN.Transforms import join_columns, merge_languages, \
+    parse_needs  # noqa: E402
+from FRMAN.Utils import Arguments, TransformExecutor, lazy_import, \
+    pretty_print  # noqa: E402
+
+pandas = lazy_import("pandas")
+
+SELECTOR = "Language"
+DETAIL = "Add any additional detail about what you need here"
+SHEET_YAML = {
+    "spanish_to_english": {"Nombre": "Name",
+                           "Que necesita?": "What do you need?",
+                           "Detalles": DETAIL},
+    "language_selector": {"column": SELECTOR,
+                          "values": {"English": "english",
+                                     "Espanol": "spanish"}},
+    "default_needs": NEEDS,
+}
+
+
+def bilingual_frame(size):
+    """SYNTHETIC FORM RESPONSES, EVERY THIRD ONE IN SPANISH."""
+    dataframe = pandas.DataFrame(intake_records(size))
+    spanish = dataframe.index % 3 == 0
+    dataframe[SELECTOR] = ["Espanol" if row else "English"
+                           for row in spanish]
+    dataframe[DETAIL] = dataframe.pop("Notes")
+    dataframe.loc[dataframe.index % 7 == 0, "What do you need?"] += \
+        ", a ride to the pharmacy"
+    for spanish_column, english_column in \
+            SHEET_YAML["spanish_to_english"].items():
+        dataframe[spanish_column] = dataframe[english_column].where(spanish)
+        dataframe.loc[spanish, english_column] = None
+    return dataframe
+
+
+def main():
+    """PARSE ARGUMENTS, RUN AND REPORT."""
+    arguments = Arguments({
+        "application": "transforms",
+        "version": "1.0",
+        "description": "FRMAN serial vs parallel cleaning benchmark",
+        "arguments": [
+            {"arg": "sizes", "action": "store", "dest": "sizes",
+             "default": "10000,100000", "help": "Comma separated row counts"},
+            {"arg": "workers", "action": "store", "dest": "workers",
+             "default": cpu_count(), "help": "Worker processes"},
+            {"arg": "chunksize", "action": "store", "dest": "chunksize",
+             "default": 5000, "help": "Rows per chunk"},
+        ]}).parse()
+    executor = TransformExecutor(workers=int(arguments["workers"]),
+                                 chunksize=int(arguments["chunksize"]),
+                                 min_rows=0)
+    executor.register(merge_languages, sheet_yaml=SHEET_YAML)
+    executor.register(parse_needs, sheet_yaml=SHEET_YAML)
+    executor.register(join_columns, target="info",
+                      columns=["additional_info", DETAIL])
+    results = []
+    for size in [int(size) for size in str(arguments["sizes"]).split(",")]:
+        dataframe = bilingual_frame(size)
+        timings = dict()
+        for name, function in (("serial", executor.run_serial),
+                               ("parallel", executor.run)):
+            began = perf_counter()
+            timings[name] = (function(dataframe), perf_counter() - began)
+        pandas.testing.assert_frame_equal(timings["serial"][0],
+                                          timings["parallel"][0])
+        for name, (_, seconds) in timings.items():
+            results.append({"path": name, "rows": size,
+                            "workers": 1 if name == "serial"
+                            else executor.workers,
+                            "seconds": round(seconds, 3),
+                            "rows_per_sec": round(size / seconds),
+                            "speedup": round(timings["serial"][1] / seconds,
+                                             2)})
+    pretty_print(pandas.DataFrame(results), showindex=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""INCREMENTAL AIRTABLE -> SQLITE SYNC AGAINST THE LOCAL FAKE SERVER."""
+
+from os.path import dirname, join
+from sys import path
+
+import pytest
+
+path.insert(0, join(dirname(dirname(__file__)), "benchmarks"))
+
+from fake_servers import FakeAirtable  # noqa: E402
+from FRMAN.Airtable import Airtable  # noqa: E402
+from FRMAN.SQL import SQL  # noqa: E402
+
+BASE = "appTest"
+TABLE = "Requests"
+
+
+@pytest.fixture
+def server():
+    fake = FakeAirtable(rate=0).start()
+    fake.seed(BASE, TABLE, [{"Name": "Neighbor {}".format(row),
+                             "Zip": str(98100 + row)} for row in range(5)])
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def airtable(server):
+    return Airtable(BASE, TABLE, "key", api_url=server.url + "/v0")
+
+
+@pytest.fixture
+def sql(tmp_path):
+    return SQL(str(tmp_path / "sync.sqlite"), schema=False)
+
+
+def test_default_sync_runs_without_delete_scan(airtable, sql):
+    result = airtable.sync_to_sql(sql)
+    assert result["upserted"] == 5 and result["deleted"] == 0
+    assert len(sql.read_sql("SELECT * FROM " + TABLE)) == 5
+
+
+def test_explicit_reconcile_without_scan_field_raises(airtable, sql):
+    with pytest.raises(ValueError):
+        airtable.sync_to_sql(sql, reconcile_deletes=True)
+
+
+def test_deleted_records_are_removed(airtable, server, sql):
+    airtable.sync_to_sql(sql, scan_field="Zip")
+    records = server.tables[(BASE, TABLE)]
+    records.pop(next(iter(records)))
+    result = airtable.sync_to_sql(sql, scan_field="Zip")
+    assert result["deleted"] == 1
+    assert len(sql.read_sql("SELECT * FROM " + TABLE)) == 4
+
+
+def test_watermark_keeps_overlap_with_modified_field(airtable, server, sql):
+    for record in server.tables[(BASE, TABLE)].values():
+        record["fields"]["Modified"] = "2999-01-01T00:00:00.000Z"
+    result = airtable.sync_to_sql(sql, modified_field="Modified")
+    assert result["watermark"] < "2999-01-01T00:00:00.000Z"
@@ -0,0 +1,41 @@
+"""JobRunner SCHEDULING AND FAILURE PROPAGATION."""
+
+from FRMAN.Runner import JobRunner
+
+
+def fail(*frames):
+    raise RuntimeError("transform failed")
+
+
+def job(steps):
+    return JobRunner({"steps": steps}, config={}, max_workers=2)
+
+
+def test_failure_skips_every_downstream_step(tmp_path):
+    db_file = str(tmp_path / "runner.sqlite")
+    runner = job({
+        "a_src": {"type": "query", "db_file": db_file,
+                  "query": "SELECT 1 AS a"},
+        "m_fail": {"type": "transform", "inputs": ["a_src"],
+                   "function": "tests.test_runner.fail"},
+        "z_load": {"type": "sql", "inputs": ["m_fail"], "db_file": db_file,
+                   "table": "loaded"},
+        "b_export": {"type": "export", "after": ["z_load"],
+                     "db_file": db_file, "query": "SELECT * FROM loaded",
+                     "file_path": str(tmp_path / "loaded.csv")},
+    })
+    runner.run()
+    statuses = {name: timing["status"]
+                for name, timing in runner.timings.items()}
+    assert statuses == {"a_src": "ok", "m_fail": "failed",
+                        "z_load": "skipped", "b_export": "skipped"}
+
+
+def test_independent_steps_all_run(tmp_path):
+    db_file = str(tmp_path / "runner.sqlite")
+    runner = job({"q{}".format(number): {
+        "type": "query", "db_file": db_file,
+        "query": "SELECT {} AS n".format(number)} for number in range(3)})
+    results = runner.run()
+    assert sorted(int(frame["n"][0]) for frame in results.values()) == \
+        [0, 1, 2]
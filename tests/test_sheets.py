@@ -0,0 +1,69 @@
+"""SheetAppender BUFFERING, RETRY AND SPOOL RECOVERY."""
+
+from FRMAN.Sheets import SheetAppender
+
+
+class FlakySheets:
+    """STAND-IN WORKSHEET WHOSE FIRST `failures` APPENDS RAISE."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.rows = []
+
+    def append_table(self, values, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("sheets unavailable")
+        self.rows.extend(values)
+
+
+class StubAppender(SheetAppender):
+    def _worksheet(self):
+        return self.sheets
+
+
+def appender(sheets, **kwargs):
+    kwargs.setdefault("interval", 60)
+    return StubAppender(sheets, "sheet", retries=0, backoff=0, **kwargs)
+
+
+def test_flush_sends_buffered_rows():
+    sheets = FlakySheets()
+    with appender(sheets) as buffered:
+        buffered.extend([[1], [2]])
+        assert buffered.flush(timeout=5)
+        assert sheets.rows == [[1], [2]]
+
+
+def test_flush_after_failure_waits_for_send():
+    sheets = FlakySheets(failures=1)
+    buffered = appender(sheets)
+    buffered.append([1])
+    assert not buffered.flush(timeout=5)
+    assert buffered.flush(timeout=5)
+    buffered.append([2])
+    assert buffered.flush(timeout=5)
+    assert sheets.rows == [[1], [2]]
+    assert buffered.close() == []
+
+
+def test_close_reports_unsent_rows(tmp_path):
+    spool = str(tmp_path / "rows.spool")
+    buffered = appender(FlakySheets(failures=10), spool=spool)
+    buffered.extend([[1], [2]])
+    assert buffered.close() == [[1], [2]]
+    sheets = FlakySheets()
+    with appender(sheets, spool=spool) as recovered:
+        assert recovered.flush(timeout=5)
+    assert sheets.rows == [[1], [2]]
+
+
+def test_truncated_spool_line_is_skipped(tmp_path):
+    spool = tmp_path / "rows.spool"
+    spool.write_text('[1, "a"]\n\n[2, "b"]\n[3, "c')
+    sheets = FlakySheets()
+    with appender(sheets, spool=str(spool)) as recovered:
+        recovered.append([4, "d"])
+        assert recovered.flush(timeout=5)
+    assert sheets.rows == [[1, "a"], [2, "b"], [4, "d"]]
+    assert spool.read_text() == ""
@@ -0,0 +1,50 @@
+"""SQL INGEST, UPSERT AND DELETE RECONCILIATION."""
+
+import pandas
+import pytest
+
+from FRMAN.SQL import SQL
+from FRMAN.Schema import SchemaRegistry
+
+
+@pytest.fixture
+def sql(tmp_path):
+    registry = SchemaRegistry(tables={"People": {
+        "columns": {"name": "TEXT", "age": "INTEGER"}}})
+    return SQL(str(tmp_path / "test.sqlite"), schema=registry)
+
+
+def people(*names):
+    return pandas.DataFrame({"name": list(names), "age": [30] * len(names)})
+
+
+def test_ingest_fail_raises_for_existing_managed_table(sql):
+    sql.ingest_df(people("ana"), "People", if_exists="fail")
+    with pytest.raises(ValueError):
+        sql.ingest_df(people("ana"), "People", if_exists="fail")
+    assert len(sql.read_sql("SELECT * FROM People")) == 1
+
+
+def test_ingest_fail_raises_for_existing_table(sql):
+    sql.ingest_df(people("ana"), "others", if_exists="fail")
+    with pytest.raises(ValueError):
+        sql.ingest_df(people("ana"), "others", if_exists="fail")
+
+
+def test_delete_missing_stages_in_temp_table(sql):
+    sql.ingest_df(people("ana", "bo", "cy"), "others")
+    assert sql.delete_missing("others", "name", ["ana", "cy"]) == 1
+    assert sorted(sql.read_sql("SELECT name FROM others")["name"]) == \
+        ["ana", "cy"]
+    assert list(sql.read_sql("SELECT name FROM sqlite_master")["name"]) == \
+        ["others"]
+
+
+def test_upsert_updates_and_inserts(sql):
+    sql.ingest_df(people("ana", "bo"), "others")
+    changed = people("bo", "cy")
+    changed["age"] = [41, 52]
+    assert sql.upsert_df(changed, "others", "name") == \
+        {"inserted": 1, "updated": 1}
+    assert dict(sql.get_dict("others", "name", "age", cache=False)) == \
+        {"ana": 30, "bo": 41, "cy": 52}